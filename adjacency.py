@@ -0,0 +1,101 @@
+import threading
+
+import numpy as np
+
+import connection
+
+_lock = threading.Lock()
+# (база, версия связей, индекс): один индекс на процесс для GUI и рабочих потоков
+_shared = None
+
+
+def build_csr(keys, targets, weights):
+    """Сжатое представление (CSR): для каждого ключа - отрезок в массивах смежности"""
+    order = np.argsort(keys, kind='stable')
+    unique_keys, starts = np.unique(keys[order], return_index=True)
+    offsets = np.append(starts, len(keys)).astype(np.int64)
+    positions = {key: i for i, key in enumerate(unique_keys.tolist())}
+    return positions, offsets, targets[order], weights[order]
+
+
+class AdjacencyIndex:
+    """Двусторонний индекс связей материал <-> продукция в памяти.
+
+    Строится одним проходом по ProductMaterials; поиск в обе стороны -
+    обращение к словарю и срез массива, без запросов к базе.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.build()
+
+    def build(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT product_id, material_id, required_quantity FROM ProductMaterials ORDER BY product_id')
+        rows = cursor.fetchall()
+        columns = list(zip(*rows)) if rows else [(), (), ()]
+        products = np.array(columns[0], dtype=np.int64)
+        materials = np.array(columns[1], dtype=np.int64)
+        quantities = np.array(columns[2], dtype=np.float64)
+
+        self.by_material = build_csr(materials, products, quantities)
+        self.by_product = build_csr(products, materials, quantities)
+
+        # Сведения о продукции для списка продукции по материалу
+        cursor.execute("""
+                       SELECT p.id, p.name, pt.coefficient, pt.id
+                       FROM Products p
+                                JOIN ProductTypes pt ON p.type_id = pt.id
+                       """)
+        self.products = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    @staticmethod
+    def lookup(csr, key):
+        positions, offsets, targets, weights = csr
+        pos = positions.get(key)
+        if pos is None:
+            return targets[:0], weights[:0]
+        start, end = offsets[pos], offsets[pos + 1]
+        return targets[start:end], weights[start:end]
+
+    def products_of(self, material_id):
+        """(id продукции, требуемое количество) для материала"""
+        return self.lookup(self.by_material, material_id)
+
+    def materials_of(self, product_id):
+        """(id материала, требуемое количество) для продукции"""
+        return self.lookup(self.by_product, product_id)
+
+    def products_by_material(self, material_id):
+        """Строки (наименование, количество, коэффициент, id типа продукции) как в get_products_by_material"""
+        product_ids, quantities = self.products_of(material_id)
+        result = []
+        for product_id, quantity in zip(product_ids.tolist(), quantities.tolist()):
+            product = self.products.get(product_id)
+            if product is not None:
+                name, coefficient, type_id = product
+                result.append((name, quantity, coefficient, type_id))
+        return result
+
+
+def links_version(conn):
+    """Счетчик изменений продукции, состава, коэффициентов типов продукции
+    и процентов потерь типов материалов (миграции 8 и 10)"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT version FROM DataVersions WHERE name = 'links'")
+    return cursor.fetchone()[0]
+
+
+def shared_index(conn):
+    """Индекс связей, общий для всех соединений процесса.
+
+    Перестраивается, только если с момента построения изменились связи:
+    правки остатков материалов его не затрагивают. Построенный индекс
+    только читается, поэтому потоки пользуются им без блокировки.
+    """
+    global _shared
+    key = (connection.DB_PATH, links_version(conn))
+    with _lock:
+        if _shared is None or _shared[:2] != key:
+            _shared = (*key, AdjacencyIndex(conn))
+        return _shared[2]
@@ -0,0 +1,260 @@
+"""Пакетный расчет количества продукции без GUI.
+
+Входной CSV: тип продукции, тип материала, количество сырья, параметр 1,
+параметр 2 (строка заголовка необязательна, см. --header). Тип задается id
+или наименованием.
+Результат - те же поля и рассчитанное количество в CSV или JSON Lines;
+как и в database.calculate_product_quantity, некорректный расчет дает -1.
+
+Примеры:
+    python batch_calculate.py scenarios.csv -o results.csv
+    python batch_calculate.py scenarios.csv -o results.jsonl --workers 8
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import numpy as np
+
+import connection
+import importer
+from calculations import calculate_quantities
+from calculator import Calculator
+
+CHUNK_SIZE = 100000
+# Файлы меньше этого размера считаются в одном процессе: пул не окупается
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+FIELDS = ['product_type', 'material_type', 'raw_quantity', 'param1', 'param2']
+
+
+class Coefficients:
+    """Коэффициенты типов продукции и проценты потерь типов материалов.
+
+    Значения загружаются один раз в массивы, индексированные по id,
+    поэтому поиск для целого блока строк - одна операция NumPy.
+    """
+
+    def __init__(self, product_types, material_types):
+        # (id -> значение, имя -> id) для каждого справочника
+        self.product_types = product_types
+        self.material_types = material_types
+        self.product_table = self.dense(product_types[0])
+        self.material_table = self.dense(material_types[0])
+
+    @classmethod
+    def load(cls, conn):
+        calculator = Calculator(conn)
+        calculator.refresh()
+        cursor = conn.cursor()
+        return cls((calculator.coefficients, importer.load_name_map(cursor, 'ProductTypes')),
+                   (calculator.loss_percentages, importer.load_name_map(cursor, 'MaterialTypes')))
+
+    @staticmethod
+    def dense(values):
+        table = np.full(max(values, default=0) + 1, np.nan)
+        for type_id, value in values.items():
+            table[type_id] = value
+        return table
+
+    @staticmethod
+    def take(table, ids):
+        """Значения по массиву id; неизвестные id (в том числе -1) дают NaN"""
+        known = (ids >= 0) & (ids < len(table))
+        return np.where(known, table[np.where(known, ids, 0)], np.nan)
+
+    @staticmethod
+    def type_ids(column, names):
+        try:
+            return np.asarray(column, dtype=np.float64).astype(np.int64)
+        except ValueError:
+            return np.array([type_id(value, names) for value in column], dtype=np.int64)
+
+    def evaluate(self, rows):
+        """Количество продукции для блока строк входного файла"""
+        columns = list(zip(*rows)) if rows else [()] * len(FIELDS)
+        product_ids = self.type_ids(columns[0], self.product_types[1])
+        material_ids = self.type_ids(columns[1], self.material_types[1])
+        return calculate_quantities(
+            self.take(self.product_table, product_ids),
+            self.take(self.material_table, material_ids),
+            *(numbers(column) for column in columns[2:5])
+        )
+
+
+def type_id(value, names):
+    """id типа из ячейки: число или наименование; -1, если тип не найден"""
+    value = value.strip()
+    try:
+        return int(float(value))
+    except ValueError:
+        return names.get(value, -1)
+
+
+def to_float(value):
+    try:
+        return float(value.replace(',', '.'))
+    except ValueError:
+        return np.nan
+
+
+def numbers(column):
+    """Столбец чисел; пустые и нечисловые значения дают NaN, а расчет - -1"""
+    try:
+        return np.asarray(column, dtype=np.float64)
+    except ValueError:
+        return np.array([to_float(value) for value in column], dtype=np.float64)
+
+
+def parse_lines(lines, delimiter):
+    """Строки входного файла по 5 полей; пустые строки пропускаются"""
+    return [(row + [''] * len(FIELDS))[:len(FIELDS)] for row in csv.reader(lines, delimiter=delimiter) if row]
+
+
+def is_header(line, delimiter):
+    """Заголовок распознается по числовым полям: все заполнены и ни одно не число.
+
+    Строка данных с пустым или ошибочным количеством (1,1,,1,1) заголовком
+    не считается: она попадает в расчет и дает -1.
+    """
+    rows = parse_lines([line], delimiter)
+    return bool(rows) and all(value.strip() and np.isnan(to_float(value)) for value in rows[0][2:])
+
+
+def format_csv(rows, quantities, delimiter):
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter=delimiter, lineterminator='\n').writerows(
+        row + [quantity] for row, quantity in zip(rows, quantities.tolist()))
+    return buffer.getvalue()
+
+
+def format_jsonl(rows, quantities, delimiter):
+    return ''.join(json.dumps(dict(zip(FIELDS, row), quantity=quantity), ensure_ascii=False) + '\n'
+                   for row, quantity in zip(rows, quantities.tolist()))
+
+
+FORMATS = {'csv': format_csv, 'jsonl': format_jsonl}
+
+
+def process_lines(lines, fmt, delimiter, coefficients=None):
+    """Разбор, расчет и форматирование блока строк; возвращает (строк, текст результата)"""
+    rows = parse_lines(lines, delimiter)
+    quantities = (coefficients or _worker_coefficients).evaluate(rows)
+    return len(rows), FORMATS[fmt](rows, quantities, delimiter)
+
+
+# Справочники в процессах пула: передаются один раз при запуске процесса
+_worker_coefficients = None
+
+
+def init_worker(coefficients):
+    global _worker_coefficients
+    _worker_coefficients = coefficients
+
+
+def process_chunks(chunks, fmt, delimiter, coefficients, workers):
+    """Результаты блоков в порядке входного файла.
+
+    В пуле процессов разбор и форматирование тоже выполняются в процессах,
+    основной процесс только читает и пишет текст. Одновременно обрабатывается
+    не больше 2 блоков на процесс, поэтому память не зависит от размера файла.
+    """
+    if workers <= 1:
+        for lines in chunks:
+            yield process_lines(lines, fmt, delimiter, coefficients)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(coefficients,)) as pool:
+        pending = deque()
+        for lines in chunks:
+            pending.append(pool.submit(process_lines, lines, fmt, delimiter))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def output_format(path, requested):
+    if requested:
+        return requested
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def default_workers(path):
+    if path != '-' and os.path.getsize(path) >= PARALLEL_MIN_BYTES:
+        return os.cpu_count() or 1
+    return 1
+
+
+def run(input_path, output_path='-', fmt=None, delimiter=',', chunk_size=CHUNK_SIZE, workers=None,
+        header=None):
+    """Расчет всех строк входного файла; возвращает (строк, секунд).
+
+    header - есть ли в файле строка заголовка; None - определить по первой строке.
+    """
+    started = time.perf_counter()
+    conn = connection.connect()
+    try:
+        coefficients = Coefficients.load(conn)
+    finally:
+        conn.close()
+    if workers is None:
+        workers = default_workers(input_path)
+
+    source = sys.stdin if input_path == '-' else open(input_path, newline='', encoding='utf-8-sig')
+    target = sys.stdout if output_path == '-' else open(output_path, 'w', newline='', encoding='utf-8')
+    fmt = output_format(output_path, fmt)
+    count = 0
+    try:
+        lines = iter(source)
+        first = next(lines, '')
+        if fmt == 'csv':
+            target.write(delimiter.join(FIELDS + ['quantity']) + '\n')
+        # Поля с переводом строки внутри кавычек не поддерживаются: блоки режутся по строкам
+        if header is None:
+            header = is_header(first, delimiter)
+        chunks = importer.batched(lines if header else chain([first], lines), chunk_size)
+        for rows, text in process_chunks(chunks, fmt, delimiter, coefficients, workers):
+            target.write(text)
+            count += rows
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+    return count, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетный расчет количества продукции из сырья")
+    parser.add_argument('input', help="CSV: тип продукции, тип материала, количество сырья, "
+                                      "параметр 1, параметр 2; '-' - стандартный ввод")
+    parser.add_argument('-o', '--output', default='-', help="файл результатов; '-' - стандартный вывод")
+    parser.add_argument('--format', choices=sorted(FORMATS),
+                        help="формат результатов; по умолчанию по расширению файла")
+    parser.add_argument('--delimiter', default=',', help="разделитель полей CSV")
+    parser.add_argument('--header', action=argparse.BooleanOptionalAction,
+                        help="первая строка - заголовок (--no-header - данные); "
+                             "по умолчанию определяется по первой строке")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="строк в блоке расчета")
+    parser.add_argument('--workers', type=int,
+                        help="число процессов; по умолчанию 1 для небольших файлов и все ядра для больших")
+    parser.add_argument('--db', help="файл базы данных")
+    args = parser.parse_args()
+
+    if args.db:
+        connection.set_database_path(args.db)
+    count, seconds = run(args.input, args.output, args.format, args.delimiter, args.chunk_size, args.workers,
+                         args.header)
+    print(f"Рассчитано строк: {count} за {seconds:.2f} с", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
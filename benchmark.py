@@ -0,0 +1,241 @@
+"""Нагрузочные замеры: импорт, список материалов, продукция по материалу,
+модель таблицы и расчет количества на синтетических данных.
+
+Примеры:
+    python benchmark.py --sizes 1000 100000 --output bench.json
+    python benchmark.py --sizes 1000000 --xlsx --compare baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import openpyxl
+
+import connection
+import importer
+from exporter import IMPORT_HEADERS, write_csv
+from migrations import migrate
+
+TYPE_COUNT = 6
+MATERIALS_PER_PRODUCT = 5
+UNITS = ['м²', 'шт', 'кг', 'м', 'л']
+
+
+class SyntheticData:
+    """Детерминированный генератор каталога по числу строк состава (ProductMaterials).
+
+    Каждая таблица генерируется своим генератором случайных чисел,
+    поэтому повторный вызов дает те же строки - для базы и для файлов Excel.
+    """
+
+    def __init__(self, bom_rows, seed=42):
+        self.bom_rows = bom_rows
+        self.seed = seed
+        self.products = max(1, -(-bom_rows // MATERIALS_PER_PRODUCT))
+        self.materials = max(MATERIALS_PER_PRODUCT, bom_rows // 20)
+
+    def rng(self, table):
+        return random.Random(f"{self.seed}-{table}")
+
+    @staticmethod
+    def material_name(i):
+        return f"Материал {i:08d}"
+
+    @staticmethod
+    def product_name(i):
+        return f"Продукт {i:08d}"
+
+    def rows(self, table):
+        """Строки таблицы в формате файла импорта"""
+        return getattr(self, f"rows_{table}")(self.rng(table))
+
+    def rows_MaterialTypes(self, rng):
+        for i in range(TYPE_COUNT):
+            yield f"Тип материала {i}", round(rng.uniform(0.001, 0.01), 4)
+
+    def rows_Materials(self, rng):
+        for i in range(self.materials):
+            yield (self.material_name(i), f"Тип материала {i % TYPE_COUNT}",
+                   round(rng.uniform(10, 10000), 2), round(rng.uniform(0, 5000), 2),
+                   round(rng.uniform(0, 1000), 2), round(rng.uniform(1, 100), 2), rng.choice(UNITS))
+
+    def rows_ProductTypes(self, rng):
+        for i in range(TYPE_COUNT):
+            yield f"Тип продукции {i}", round(rng.uniform(1, 5), 2)
+
+    def rows_Products(self, rng):
+        for i in range(self.products):
+            yield (f"Тип продукции {i % TYPE_COUNT}", self.product_name(i), str(1000000 + i),
+                   round(rng.uniform(1000, 50000), 2))
+
+    def rows_ProductMaterials(self, rng):
+        remaining = self.bom_rows
+        for i in range(self.products):
+            count = min(MATERIALS_PER_PRODUCT, remaining)
+            for material in rng.sample(range(self.materials), count):
+                yield self.material_name(material), self.product_name(i), round(rng.uniform(0.1, 10), 2)
+            remaining -= count
+
+    def fill_database(self, conn):
+        """Заполнение базы напрямую, без файлов Excel"""
+        cursor = conn.cursor()
+        maps = {}
+        log_triggers = importer.pause_change_log(cursor)
+        for table, _, _ in importer.IMPORT_FILES:
+            importer.write_table(cursor, table, self.rows(table), maps)
+            if table != 'ProductMaterials':
+                maps[table] = importer.load_name_map(cursor, table)
+        importer.reset_change_log(cursor, log_triggers)
+        conn.commit()
+
+    def write_xlsx(self, directory):
+        """Файлы *_import.xlsx с теми же данными; возвращает список для importer.IMPORT_FILES"""
+        files = []
+        for table, file_name, columns in importer.IMPORT_FILES:
+            path = os.path.join(directory, file_name)
+            wb = openpyxl.Workbook(write_only=True)
+            sheet = wb.create_sheet()
+            sheet.append(IMPORT_HEADERS[table])
+            for row in self.rows(table):
+                sheet.append(row)
+            wb.save(path)
+            files.append((table, path, columns))
+        return files
+
+    def write_csv(self, directory):
+        """Файлы *_import.csv с теми же данными"""
+        files = importer.source_files(directory, '.csv')
+        for table, path, _ in files:
+            write_csv(path, IMPORT_HEADERS[table], self.rows(table))
+        return files
+
+
+def timed(func, repeat=1):
+    """Минимальное время выполнения из repeat запусков, в секундах"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_size(bom_rows, with_xlsx=False, seed=42, samples=100, with_csv=False):
+    data = SyntheticData(bom_rows, seed)
+    workdir = tempfile.mkdtemp(prefix='obraz_bench_')
+    results = {}
+    try:
+        connection.set_database_path(os.path.join(workdir, 'obraz_plus.db'))
+        conn = connection.connect('bulk')
+        migrate(conn)
+
+        if with_xlsx or with_csv:
+            import database
+            if with_xlsx:
+                files = data.write_xlsx(workdir)
+                results['import_from_excel'] = timed(lambda: database.import_from_excel(files=files))
+            if with_csv:
+                csv_files = data.write_csv(workdir)
+                results['import_from_csv'] = timed(lambda: database.import_from_excel(files=csv_files))
+        else:
+            results['fill_database'] = timed(lambda: data.fill_database(conn))
+        conn.close()
+
+        # Импорт GUI только после выбора платформы без экрана
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt6.QtWidgets import QApplication
+        # Экземпляр приложения должен существовать, пока живут объекты Qt
+        app = QApplication.instance() or QApplication(sys.argv)
+        import gui
+
+        db = gui.DatabaseManager()
+        results['get_materials'] = timed(db.get_materials, repeat=3)
+
+        rng = random.Random(seed)
+        material_ids = [rng.randint(1, data.materials) for _ in range(samples)]
+        results['products_index_build'] = timed(db.get_adjacency)
+        results['get_products_by_material'] = timed(
+            lambda: [db.get_products_by_material(m) for m in material_ids]) / samples
+
+        model = gui.MaterialModel(db, ["Материал", "Тип материала", "На складе", "Мин. кол-во", "Требуется"])
+        results['model_load_data'] = timed(model.load_data, repeat=3)
+
+        def fetch_all():
+            model.load_data()
+            while model.canFetchMore():
+                model.fetchMore()
+        results['model_fetch_all'] = timed(fetch_all)
+
+        type_ids = [rng.randint(1, TYPE_COUNT) for _ in range(samples)]
+        results['calculate_product_quantity'] = timed(
+            lambda: [db.calculate_product_quantity(t, t, 1000, 1.5, 2) for t in type_ids]) / samples
+        batch_types = [rng.randint(1, TYPE_COUNT) for _ in range(data.products)]
+        results['calculate_product_quantities'] = timed(
+            lambda: db.calculate_product_quantities(batch_types, 1, 1000, 1.5, 2), repeat=3)
+        results['capacity_engine_build'] = timed(db.get_capacity_engine)
+    finally:
+        connection.close_thread_connection()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(current, baseline, threshold):
+    """Замеры, ставшие медленнее базовых более чем на threshold (доля)"""
+    regressions = []
+    for size, results in current['sizes'].items():
+        base = baseline.get('sizes', {}).get(size, {})
+        for name, seconds in results.items():
+            old = base.get(name)
+            if old and seconds > old * (1 + threshold):
+                regressions.append((size, name, old, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности на синтетических данных")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="число строк состава (ProductMaterials), от 10^3 до 10^7")
+    parser.add_argument('--xlsx', action='store_true', help="генерировать файлы Excel и замерять импорт")
+    parser.add_argument('--csv', action='store_true', help="генерировать файлы CSV и замерять импорт")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--compare', help="файл базовых результатов для поиска регрессий")
+    parser.add_argument('--threshold', type=float, default=0.2, help="допустимое замедление, доля")
+    args = parser.parse_args()
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'sizes': {},
+    }
+    for size in args.sizes:
+        print(f"Размер {size} строк состава...")
+        report['sizes'][str(size)] = results = run_size(size, args.xlsx, args.seed, with_csv=args.csv)
+        for name, seconds in results.items():
+            print(f"  {name}: {seconds * 1000:.3f} мс")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for size, name, old, new in regressions:
+            print(f"Регрессия [{size}] {name}: {old * 1000:.3f} мс -> {new * 1000:.3f} мс")
+        if regressions:
+            sys.exit(1)
+        print("Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import math
+
+import numpy as np
+
+
+def calculate_quantities(coefficients, loss_percentages, raw_quantities, param1, param2):
+    """Векторный расчет количества продукции из сырья с учетом потерь.
+
+    Аргументы - массивы одинаковой длины или скаляры. Неизвестный коэффициент
+    или процент потерь передается как NaN. Как и в скалярном расчете, для
+    некорректных результатов (деление на ноль, отрицательное количество)
+    возвращается -1.
+    """
+    coefficients, loss, raw, param1, param2 = np.broadcast_arrays(
+        *(np.asarray(value, dtype=np.float64) for value in
+          (coefficients, loss_percentages, raw_quantities, param1, param2)))
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # Расчет сырья на 1 единицу продукции
+        raw_per_unit = param1 * param2 * coefficients
+        # Учет потерь
+        effective_raw = raw * (1 - loss / 100)
+        product_quantity = effective_raw / raw_per_unit
+
+    valid = (raw_per_unit != 0) & np.isfinite(product_quantity) & (product_quantity >= 0)
+    result = np.full(product_quantity.shape, -1, dtype=np.int64)
+    result[valid] = product_quantity[valid].astype(np.int64)
+    return result
+
+
+def calculate_quantity(coefficient, loss_percentage, raw_quantity, param1, param2):
+    """Скалярный вариант calculate_quantities для одного расчета без накладных расходов NumPy.
+
+    Неизвестный коэффициент или процент потерь передается как None.
+    """
+    if coefficient is None or loss_percentage is None:
+        return -1
+    raw_per_unit = param1 * param2 * coefficient
+    if raw_per_unit == 0:
+        return -1
+    product_quantity = raw_quantity * (1 - loss_percentage / 100) / raw_per_unit
+    if not math.isfinite(product_quantity) or product_quantity < 0:
+        return -1
+    return int(product_quantity)
+
+
+def lookup(ids, values):
+    """Значения словаря id -> значение для массива id; неизвестные id и None дают NaN"""
+    try:
+        ids = np.asarray(ids, dtype=np.int64)
+    except TypeError:
+        # Есть id None (материал без типа): поэлементно, медленнее np.unique
+        ids = np.asarray(ids, dtype=object)
+        table = [values.get(i, np.nan) for i in ids.ravel()]
+        return np.array(table, dtype=np.float64).reshape(ids.shape)
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    table = np.array([values.get(int(i), np.nan) for i in unique_ids], dtype=np.float64)
+    return table[inverse].reshape(ids.shape)
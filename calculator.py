@@ -0,0 +1,78 @@
+"""Расчет количества продукции по справочникам типов в памяти.
+
+Коэффициенты типов продукции, проценты потерь и список типов материалов
+читаются один раз на соединение. Перед обращением к справочникам
+проверяется PRAGMA data_version - счетчик в заголовке базы, без чтения
+таблиц: справочники перечитываются, только если в базу с тех пор писало
+другое соединение (например, импорт). Своих изменений справочников
+калькулятор не отслеживает: их пишет только импорт через отдельное соединение.
+"""
+import threading
+
+from connection import get_connection
+
+# id потока -> калькулятор; как и соединения (connection.get_connection),
+# не threading.local, чтобы переживать задачи в потоках QThreadPool
+_calculators = {}
+_lock = threading.Lock()
+
+
+class Calculator:
+    def __init__(self, conn):
+        self.conn = conn
+        self.version = None
+        self.coefficients = {}
+        self.loss_percentages = {}
+        self.types = []
+
+    def refresh(self):
+        cursor = self.conn.cursor()
+        cursor.execute('PRAGMA data_version')
+        version = cursor.fetchone()[0]
+        if version == self.version:
+            return
+        cursor.execute('SELECT id, coefficient FROM ProductTypes')
+        self.coefficients = dict(cursor.fetchall())
+        cursor.execute('SELECT id, name, loss_percentage FROM MaterialTypes ORDER BY id')
+        rows = cursor.fetchall()
+        self.types = [(type_id, name) for type_id, name, _ in rows]
+        self.loss_percentages = {type_id: loss for type_id, _, loss in rows}
+        self.version = version
+
+    def material_types(self):
+        """Типы материалов (id, наименование) в порядке id"""
+        self.refresh()
+        return list(self.types)
+
+    def quantity(self, product_type_id, material_type_id, raw_quantity, param1, param2):
+        """Количество продукции из сырья с учетом потерь; -1 для неизвестного типа
+        и некорректного результата"""
+        from calculations import calculate_quantity
+
+        self.refresh()
+        return calculate_quantity(self.coefficients.get(product_type_id),
+                                  self.loss_percentages.get(material_type_id),
+                                  raw_quantity, param1, param2)
+
+    def quantities(self, product_type_ids, material_type_ids, raw_quantities, param1, param2):
+        """Пакетный расчет: аргументы - массивы одинаковой длины или скаляры"""
+        # NumPy загружается при первом расчете, а не при запуске GUI
+        from calculations import calculate_quantities, lookup
+
+        self.refresh()
+        return calculate_quantities(
+            lookup(product_type_ids, self.coefficients),
+            lookup(material_type_ids, self.loss_percentages),
+            raw_quantities, param1, param2
+        )
+
+
+def get_calculator():
+    """Калькулятор на соединении текущего потока (connection.get_connection)"""
+    conn = get_connection()
+    thread_id = threading.get_ident()
+    with _lock:
+        calculator = _calculators.get(thread_id)
+        if calculator is None or calculator.conn is not conn:
+            calculator = _calculators[thread_id] = Calculator(conn)
+    return calculator
@@ -0,0 +1,140 @@
+import numpy as np
+
+
+class CapacityEngine:
+    """Производственные возможности: сколько единиц каждой продукции можно
+    изготовить из текущих остатков материалов с учетом всех строк состава,
+    коэффициента типа продукции и процента потерь типа материала.
+
+    Результаты хранятся в индексе по продукции; при изменении одного
+    материала пересчитываются только продукты, в состав которых он входит.
+    """
+    HEADERS = ["Продукция", "Артикул", "Можно изготовить", "Лимитирующий материал"]
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.build()
+
+    def build(self):
+        """Полный пересчет по всему каталогу одним запросом и одним проходом NumPy"""
+        query = """
+                SELECT pm.product_id,
+                       pm.material_id,
+                       pm.required_quantity * pt.coefficient AS need,
+                       1 - mt.loss_percentage / 100          AS keep,
+                       m.stock_quantity
+                FROM ProductMaterials pm
+                         JOIN Materials m ON m.id = pm.material_id
+                         JOIN Products p ON p.id = pm.product_id
+                         LEFT JOIN ProductTypes pt ON pt.id = p.type_id
+                         LEFT JOIN MaterialTypes mt ON mt.id = m.type_id
+                ORDER BY pm.product_id
+                """
+        cursor = self.conn.cursor()
+        cursor.execute(query)
+        rows = cursor.fetchall()
+
+        columns = list(zip(*rows)) if rows else [(), (), (), (), ()]
+        self.row_product = np.array(columns[0], dtype=np.int64)
+        self.row_material = np.array(columns[1], dtype=np.int64)
+        self.row_need = np.array(columns[2], dtype=np.float64)
+        self.row_keep = np.array(columns[3], dtype=np.float64)
+        self.row_stock = np.array(columns[4], dtype=np.float64)
+
+        # Строки отсортированы по продукции: каждая продукция - непрерывный отрезок
+        self.product_ids, self.starts, self.row_group = np.unique(
+            self.row_product, return_index=True, return_inverse=True)
+        self.ends = np.append(self.starts[1:], len(self.row_product)).astype(np.int64)
+        self.product_pos = {int(pid): i for i, pid in enumerate(self.product_ids.tolist())}
+
+        # Строки состава для каждого материала
+        order = np.argsort(self.row_material, kind='stable')
+        material_ids, material_starts = np.unique(self.row_material[order], return_index=True)
+        self.material_rows = dict(zip(material_ids.tolist(),
+                                      np.split(order, material_starts[1:])))
+
+        units = self.units(slice(None))
+        self.capacity = np.full(len(self.product_ids), -1, dtype=np.int64)
+        self.bottleneck = np.zeros(len(self.product_ids), dtype=np.int64)
+        if len(units):
+            # Внутри каждой продукции первой идет строка с наименьшим запасом
+            order = np.lexsort((units, self.row_group))
+            first = order[self.starts]
+            self.capacity = self.to_capacity(units[first])
+            self.bottleneck = self.row_material[first]
+
+        # Наименования для вывода результатов
+        cursor.execute('SELECT id, name, article FROM Products')
+        self.products = {row[0]: row[1:] for row in cursor.fetchall()}
+        cursor.execute('SELECT id, name FROM Materials')
+        self.material_names = dict(cursor.fetchall())
+
+    def units(self, rows):
+        """Единиц продукции, обеспеченных каждой строкой состава"""
+        need = self.row_need[rows]
+        effective = self.row_stock[rows] * self.row_keep[rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            units = np.where(need > 0, effective / need, np.inf)
+        # Неизвестный коэффициент или процент потерь делает расчет невозможным
+        return np.where(np.isnan(need) | np.isnan(effective), -np.inf, units)
+
+    @staticmethod
+    def to_capacity(min_units):
+        result = np.full(min_units.shape, -1, dtype=np.int64)
+        valid = np.isfinite(min_units)
+        result[valid] = np.floor(np.maximum(min_units[valid], 0)).astype(np.int64)
+        return result
+
+    def refresh_material(self, material_id):
+        """Перечитать остаток и потери одного материала и пересчитать зависящую от него продукцию"""
+        rows = self.material_rows.get(material_id)
+        if rows is None:
+            return []
+        cursor = self.conn.cursor()
+        cursor.execute("""
+                       SELECT m.stock_quantity, 1 - mt.loss_percentage / 100, m.name
+                       FROM Materials m
+                                LEFT JOIN MaterialTypes mt ON mt.id = m.type_id
+                       WHERE m.id = ?
+                       """, (material_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return []
+        stock, keep, self.material_names[material_id] = row
+        self.row_stock[rows] = stock
+        self.row_keep[rows] = np.nan if keep is None else keep
+        return self.recalculate(np.unique(self.row_group[rows]))
+
+    def recalculate(self, groups):
+        for group in groups.tolist():
+            start, end = self.starts[group], self.ends[group]
+            units = self.units(slice(start, end))
+            best = int(np.argmin(units))
+            self.capacity[group] = self.to_capacity(units[best:best + 1])[0]
+            self.bottleneck[group] = self.row_material[start + best]
+        return self.product_ids[groups].tolist()
+
+    def material_name(self, pos):
+        return self.material_names.get(int(self.bottleneck[pos]), "")
+
+    def get(self, product_id):
+        """(количество, наименование лимитирующего материала) или None, если у продукции нет состава"""
+        pos = self.product_pos.get(product_id)
+        if pos is None:
+            return None
+        return int(self.capacity[pos]), self.material_name(pos)
+
+    def results(self):
+        """Список (id продукции, количество, наименование лимитирующего материала)"""
+        return [(product_id, count, self.material_name(pos))
+                for pos, (product_id, count) in enumerate(zip(self.product_ids.tolist(),
+                                                              self.capacity.tolist()))]
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def row(self, pos):
+        """Строка в порядке HEADERS; количество None, если расчет невозможен"""
+        name, article = self.products.get(int(self.product_ids[pos]), ("", ""))
+        count = int(self.capacity[pos])
+        return name, article, count if count >= 0 else None, self.material_name(pos)
@@ -0,0 +1,94 @@
+import os
+import sqlite3
+import threading
+
+import instrumentation
+
+# Путь к базе: переменная окружения OBRAZ_PLUS_DB или файл рядом с приложением
+DB_PATH = os.environ.get('OBRAZ_PLUS_DB', 'obraz_plus.db')
+
+# Размер кэша подготовленных выражений на соединение (по умолчанию в sqlite3 - 128)
+STATEMENT_CACHE_SIZE = 512
+
+# Профили настроек соединения
+PROFILES = {
+    # Интерактивная работа: WAL, чтобы чтение не ждало запись
+    'default': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,        # 64 МБ
+        'mmap_size': 268435456,      # 256 МБ
+        'temp_store': 'MEMORY',
+    },
+    # Массовая загрузка: меньше fsync, больше кэш
+    'bulk': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -262144,       # 256 МБ
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+    # Максимальная надежность записи: правки пользователя (WriteBehindQueue)
+    'safe': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16384,        # 16 МБ
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+    },
+}
+
+# Соединения потоков: (id потока, база, профиль) -> соединение. threading.local
+# не подходит: в потоках QThreadPool его данные теряются между задачами
+_connections = {}
+_lock = threading.Lock()
+
+
+def set_database_path(path):
+    """Сменить файл базы; соединения текущего потока закрываются"""
+    global DB_PATH
+    DB_PATH = path
+    close_thread_connection()
+
+
+def connect(profile='default', path=None, check_same_thread=True):
+    """Новое соединение с настройками профиля"""
+    # С трассировкой соединение замеряет каждый запрос, без нее - обычное соединение
+    factory = instrumentation.TracingConnection if instrumentation.enabled else sqlite3.Connection
+    conn = sqlite3.connect(path or DB_PATH, cached_statements=STATEMENT_CACHE_SIZE, factory=factory,
+                           check_same_thread=check_same_thread)
+    for pragma, value in PROFILES[profile].items():
+        conn.execute(f'PRAGMA {pragma} = {value}')
+    return conn
+
+
+def get_connection(profile='default'):
+    """Соединение текущего потока: открывается один раз и переиспользуется.
+
+    Закрыть его можно и из другого потока (close_connection), когда
+    владелец уже не выполняет запросов - например, при остановке пула.
+    """
+    key = (threading.get_ident(), DB_PATH, profile)
+    with _lock:
+        conn = _connections.get(key)
+    if conn is None:
+        conn = connect(profile, check_same_thread=False)
+        with _lock:
+            _connections[key] = conn
+    return conn
+
+
+def close_connection(conn):
+    """Закрыть соединение get_connection и забыть его"""
+    with _lock:
+        for key in [key for key, value in _connections.items() if value is conn]:
+            del _connections[key]
+    conn.close()
+
+
+def close_thread_connection():
+    thread_id = threading.get_ident()
+    with _lock:
+        connections = [_connections.pop(key) for key in list(_connections) if key[0] == thread_id]
+    for conn in connections:
+        conn.close()
@@ -0,0 +1,171 @@
+"""Потоковый экспорт в XLSX, CSV и TSV.
+
+Строки читаются из курсора пачками и сразу пишутся в файл (XLSX - в режиме
+write_only), поэтому память не зависит от числа строк. Файлы таблиц
+в формате импорта загружаются обратно через database.import_from_excel.
+
+Примеры:
+    python exporter.py backup_dir
+    python exporter.py backup_dir .csv
+"""
+import csv
+import os
+import sys
+
+import numpy as np
+
+import importer
+from calculations import calculate_quantities
+
+# Строк в одной выборке fetchmany
+FETCH_SIZE = 5000
+
+# Заголовки файлов импорта, как в исходных книгах
+IMPORT_HEADERS = {
+    'MaterialTypes': ('Тип материала', 'Процент потерь сырья '),
+    'Materials': ('Наименование материала', 'Тип материала', 'Цена единицы материала',
+                  'Количество на складе', 'Минимальное количество', 'Количество в упаковке',
+                  'Единица измерения'),
+    'ProductTypes': ('Тип продукции', 'Коэффициент типа продукции'),
+    'Products': ('Тип продукции', 'Наименование продукции', 'Артикул',
+                 'Минимальная стоимость для партнера'),
+    'ProductMaterials': ('Наименование материала', 'Продукция', 'Необходимое количество материала'),
+}
+
+# Строки таблиц в порядке столбцов файлов импорта; ссылки - по наименованию
+EXPORT_QUERIES = {
+    'MaterialTypes': 'SELECT name, loss_percentage FROM MaterialTypes ORDER BY id',
+    'Materials': '''
+                 SELECT m.name, mt.name, m.unit_price, m.stock_quantity,
+                        m.min_quantity, m.package_quantity, m.unit_of_measure
+                 FROM Materials m
+                          LEFT JOIN MaterialTypes mt ON mt.id = m.type_id
+                 ORDER BY m.id
+                 ''',
+    'ProductTypes': 'SELECT name, coefficient FROM ProductTypes ORDER BY id',
+    'Products': '''
+                SELECT pt.name, p.name, p.article, p.min_partner_price
+                FROM Products p
+                         LEFT JOIN ProductTypes pt ON pt.id = p.type_id
+                ORDER BY p.id
+                ''',
+    'ProductMaterials': '''
+                        SELECT m.name, p.name, pm.required_quantity
+                        FROM ProductMaterials pm
+                                 JOIN Products p ON p.id = pm.product_id
+                                 JOIN Materials m ON m.id = pm.material_id
+                        ORDER BY pm.product_id, pm.material_id
+                        ''',
+}
+
+PRODUCT_HEADERS = ("Продукция", "Требуемое количество", "Коэффициент", "Расчетное количество")
+
+
+def iter_query(conn, query, params=()):
+    """Строки запроса пачками по FETCH_SIZE"""
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    return iter_cursor(cursor)
+
+
+def iter_cursor(cursor):
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+
+def write_xlsx(path, headers, rows):
+    # Импорт при первой выгрузке в XLSX: openpyxl заметно удлиняет запуск GUI
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+    sheet = wb.create_sheet()
+    sheet.append(headers)
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    wb.save(path)
+    return count
+
+
+def write_csv(path, headers, rows, delimiter=';'):
+    # utf-8-sig и ';' - чтобы файл открывался в Excel без настройки импорта
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f, delimiter=delimiter)
+        writer.writerow(headers)
+        count = 0
+        for chunk in importer.batched(rows, FETCH_SIZE):
+            writer.writerows(chunk)
+            count += len(chunk)
+    return count
+
+
+def write_rows(path, headers, rows):
+    """Запись строк в XLSX, CSV или TSV по расширению файла; возвращает число строк"""
+    if path.lower().endswith('.csv'):
+        return write_csv(path, headers, rows)
+    if path.lower().endswith('.tsv'):
+        return write_csv(path, headers, rows, delimiter='\t')
+    return write_xlsx(path, headers, rows)
+
+
+def export_tables(conn, directory, extension='.xlsx'):
+    """Все таблицы в файлы импорта (.xlsx, .csv или .tsv); возвращает список для import_from_excel(files=...)"""
+    os.makedirs(directory, exist_ok=True)
+    files = importer.source_files(directory, extension)
+    for table, path, _ in files:
+        count = write_rows(path, IMPORT_HEADERS[table], iter_query(conn, EXPORT_QUERIES[table]))
+        print(f"{table}: выгружено строк {count}")
+    return files
+
+
+def iter_products(conn, material_id, stock_quantity=None, param1=None, param2=None):
+    """Продукция с материалом; с параметрами - и расчетное количество из остатка материала.
+
+    Продукция без типа пропускается, как и в окне продукции (AdjacencyIndex).
+
+    Расчет идет по пачкам строк: коэффициент и процент потерь берутся
+    в том же запросе, количество считается одним проходом NumPy на пачку.
+    """
+    query = """
+            SELECT p.name, pm.required_quantity, pt.coefficient, mt.loss_percentage
+            FROM ProductMaterials pm
+                     JOIN Products p ON p.id = pm.product_id
+                     JOIN ProductTypes pt ON pt.id = p.type_id
+                     JOIN Materials m ON m.id = pm.material_id
+                     LEFT JOIN MaterialTypes mt ON mt.id = m.type_id
+            WHERE pm.material_id = ?
+            ORDER BY pm.product_id
+            """
+    calculate = param1 is not None and param2 is not None
+    for chunk in importer.batched(iter_query(conn, query, (material_id,)), FETCH_SIZE):
+        if calculate:
+            columns = list(zip(*chunk))
+            quantities = calculate_quantities(
+                np.array(columns[2], dtype=np.float64), np.array(columns[3], dtype=np.float64),
+                stock_quantity, param1, param2).tolist()
+        else:
+            quantities = [None] * len(chunk)
+        for (name, required, coefficient, _), quantity in zip(chunk, quantities):
+            yield name, required, coefficient, quantity
+
+
+def export_products(conn, material_id, path, stock_quantity=None, param1=None, param2=None):
+    rows = iter_products(conn, material_id, stock_quantity, param1, param2)
+    return write_rows(path, PRODUCT_HEADERS, rows)
+
+
+if __name__ == "__main__":
+    from connection import connect
+    from migrations import migrate
+
+    if len(sys.argv) < 2:
+        print("Использование: python exporter.py <папка> [.xlsx|.csv|.tsv]")
+        sys.exit(1)
+    conn = connect()
+    migrate(conn)
+    export_tables(conn, sys.argv[1], *sys.argv[2:3])
+    conn.close()
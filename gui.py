@@ -1,10 +1,29 @@
-import sys
 import sqlite3
+import sys
+from array import array
+from collections import Counter
+from functools import lru_cache
+
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QTableView, QVBoxLayout, QWidget,
                              QDialog, QLabel, QLineEdit, QComboBox, QPushButton, QFormLayout,
-                             QMessageBox, QHeaderView, QAbstractItemView, QHBoxLayout, QMenu)
+                             QMessageBox, QHeaderView, QAbstractItemView, QHBoxLayout, QMenu,
+                             QFileDialog)
 from PyQt6.QtGui import QStandardItemModel, QStandardItem, QFont, QIcon, QPixmap, QAction
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+
+from calculator import get_calculator
+import connection
+from connection import get_connection
+import instrumentation
+from migrations import get_version, migrate
+from snapshot import Snapshot, snapshot_path, write_snapshot
+from workers import AsyncQueryRunner, WriteBehindQueue
+
+# Модули на NumPy и openpyxl (расчеты, индексы, план закупок, экспорт) импортируются
+# в методах, которые их используют: до первого окна они не нужны
+
+ICON_PATH = 'Образ плюс.ico'
+LOGO_PATH = 'Образ плюс.png'
 
 APP_STYLE = """
     QMainWindow { 
@@ -45,129 +64,793 @@ APP_STYLE = """
 
 
 class DatabaseManager:
-    def __init__(self):
-        self.conn = sqlite3.connect('obraz_plus.db')
+    def __init__(self, profile='default'):
+        self.conn = get_connection(profile)
+        migrate(self.conn)
+        # Справочники типов в памяти, общие с database.calculate_product_quantity
+        self.calculator = get_calculator()
+        # Счетчик изменений, сделанных через это соединение: PRAGMA data_version
+        # их не видит, а MainWindow.poll_changes должен обновить список
+        self.changes = 0
+        self.capacity = None
+        self.capacity_seq = None
+        self.capacity_links = None
+
+    def close(self):
+        connection.close_connection(self.conn)
+
+    def data_version(self):
+        """Версия данных: меняется при коммите через это или любое другое соединение"""
+        cursor = self.conn.cursor()
+        cursor.execute('PRAGMA data_version')
+        return self.changes, cursor.fetchone()[0]
 
     def get_materials(self):
         query = """
                 SELECT m.id,
                        m.name,
-                       mt.name                                AS type_name,
+                       mt.name                         AS type_name,
                        m.stock_quantity,
                        m.min_quantity,
-                       COALESCE(SUM(pm.required_quantity), 0) AS required_qty,
-                       mt.id                                  AS type_id
+                       COALESCE(s.total_required, 0)   AS required_qty,
+                       mt.id                           AS type_id
                 FROM Materials m
                          LEFT JOIN MaterialTypes mt ON m.type_id = mt.id
-                         LEFT JOIN ProductMaterials pm ON m.id = pm.material_id
-                GROUP BY m.id, mt.name
+                         LEFT JOIN MaterialSummary s ON s.material_id = m.id
+                ORDER BY m.id
                 """
         cursor = self.conn.cursor()
         cursor.execute(query)
         return cursor.fetchall()
 
-    def get_material_types(self):
-        query = 'SELECT id, name FROM MaterialTypes'
+    @staticmethod
+    def search_expression(text):
+        """Запрос FTS5: каждое слово ищется как префикс, все слова обязательны"""
+        words = text.split()
+        return ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+
+    # Ключи сортировки по номеру столбца таблицы материалов; столбец 1 (тип)
+    # сортируется по группам типов, см. get_materials_page_by_type
+    SORT_KEYS = {0: 'm.name', 2: 'm.stock_quantity', 3: 'm.min_quantity', 4: 's.total_required'}
+    TYPE_COLUMN = 1
+    # Больше изменений выгоднее перечитать, чем применять к модели по одному
+    MAX_INCREMENTAL_CHANGES = 1000
+    # Размер страницы при выгрузке списка в файл
+    EXPORT_PAGE_SIZE = 5000
+
+    def select_materials(self, source, conditions, params, order, limit):
+        query = f"""
+                SELECT m.id,
+                       m.name,
+                       mt.name                         AS type_name,
+                       m.stock_quantity,
+                       m.min_quantity,
+                       COALESCE(s.total_required, 0)   AS required_qty,
+                       mt.id                           AS type_id
+                FROM {source}
+                         LEFT JOIN MaterialTypes mt ON m.type_id = mt.id
+                WHERE {' AND '.join(conditions) or '1'}
+                ORDER BY {order}
+                LIMIT ?
+                """
         cursor = self.conn.cursor()
-        cursor.execute(query)
+        cursor.execute(query, (*params, limit))
         return cursor.fetchall()
 
+    def get_materials_page(self, after_id, limit, search=None, type_id=None,
+                           sort_column=None, descending=False, after_value=None):
+        """Страница списка материалов после строки (after_value, after_id).
+
+        search - текст для поиска по наименованию и единице измерения,
+        type_id - фильтр по типу материала, sort_column - номер столбца для
+        сортировки (None - по id). Страницы выбираются по ключу (keyset),
+        а не через OFFSET, поэтому любая страница стоит как первая.
+        after_id = 0 означает первую страницу.
+        """
+        source = 'Materials m LEFT JOIN MaterialSummary s ON s.material_id = m.id'
+        filters = []
+        params = []
+        if type_id is not None:
+            filters.append('m.type_id = ?')
+            params.append(type_id)
+
+        if sort_column is None:
+            if search and search.strip():
+                # Выборка идет от полнотекстового индекса в порядке rowid, чтобы LIMIT
+                # останавливал поиск, не собирая все совпадения
+                source = ('MaterialsSearch f JOIN Materials m ON m.id = f.rowid '
+                          'LEFT JOIN MaterialSummary s ON s.material_id = m.id')
+                filters += ['MaterialsSearch MATCH ?', 'f.rowid > ?']
+                params += [self.search_expression(search), after_id]
+                return self.select_materials(source, filters, params, 'f.rowid', limit)
+            return self.select_materials(source, filters + ['m.id > ?'], params + [after_id], 'm.id', limit)
+
+        if search and search.strip():
+            filters.append('m.id IN (SELECT rowid FROM MaterialsSearch WHERE MaterialsSearch MATCH ?)')
+            params.append(self.search_expression(search))
+
+        if sort_column == self.TYPE_COLUMN:
+            return self.get_materials_page_by_type(source, filters, params, after_id, after_value,
+                                                   limit, descending)
+
+        key = self.SORT_KEYS[sort_column]
+        id_key = 'm.id'
+        if sort_column == 4:
+            # Сводка есть у каждого материала: идем по индексу сводки
+            source = 'MaterialSummary s JOIN Materials m ON m.id = s.material_id'
+            id_key = 's.material_id'
+        direction = 'DESC' if descending else 'ASC'
+        compare = '<' if descending else '>'
+        order = f'{key} {direction}, {id_key} {direction}'
+
+        if not after_id:
+            return self.select_materials(source, filters, params, order, limit)
+
+        # Сначала оставшиеся строки с тем же значением ключа, затем следующие значения:
+        # так оба запроса идут по индексу без сканирования совпадающих значений
+        rows = self.select_materials(source, filters + [f'{key} = ?', f'{id_key} {compare} ?'],
+                                     params + [after_value, after_id], f'{id_key} {direction}', limit)
+        if len(rows) < limit:
+            rows += self.select_materials(source, filters + [f'{key} {compare} ?'],
+                                          params + [after_value], order, limit - len(rows))
+        return rows
+
+    def get_materials_page_by_type(self, source, filters, params, after_id, after_type, limit, descending):
+        """Сортировка по типу: группы типов по наименованию, внутри группы - по id.
+
+        Каждая группа читается по индексу (type_id, id); материалы без типа
+        идут первыми. after_type - id типа последней строки (None - без типа).
+        """
+        groups = self.get_type_groups()
+        if descending:
+            groups.reverse()
+        direction = 'DESC' if descending else 'ASC'
+        compare = '<' if descending else '>'
+
+        start = groups.index(after_type) if after_id and after_type in groups else 0
+        rows = []
+        for pos in range(start, len(groups)):
+            group = groups[pos]
+            conditions = filters + ['m.type_id IS NULL' if group is None else 'm.type_id = ?']
+            group_params = params + ([] if group is None else [group])
+            if after_id and pos == start:
+                conditions.append(f'm.id {compare} ?')
+                group_params.append(after_id)
+            rows += self.select_materials(source, conditions, group_params, f'm.id {direction}', limit - len(rows))
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def iter_materials(self, search=None, type_id=None, sort_column=None, descending=False,
+                       page_size=EXPORT_PAGE_SIZE):
+        """Все строки списка материалов с отбором и сортировкой, по страницам get_materials_page"""
+        after_id, after_value = 0, None
+        while True:
+            rows = self.get_materials_page(after_id, page_size, search, type_id, sort_column, descending,
+                                           after_value)
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last = rows[-1]
+            after_id = last[0]
+            if sort_column is not None:
+                after_value = last[6] if sort_column == self.TYPE_COLUMN else last[sort_column + 1]
+
+    def export_materials(self, path, headers, search=None, type_id=None, sort_column=None, descending=False):
+        """Список материалов, как в таблице главного окна, в XLSX или CSV"""
+        rows = ((name, type_name or "", stock, min_qty, required)
+                for _, name, type_name, stock, min_qty, required, _ in
+                self.iter_materials(search, type_id, sort_column, descending))
+        import exporter
+        return exporter.write_rows(path, headers, rows)
+
+    def export_products(self, material_id, path, stock_quantity=None, param1=None, param2=None):
+        import exporter
+        return exporter.export_products(self.conn, material_id, path, stock_quantity, param1, param2)
+
+    def export_tables(self, directory):
+        import exporter
+        return exporter.export_tables(self.conn, directory)
+
+    def get_type_groups(self):
+        """Порядок групп при сортировке по типу: без типа, затем типы по наименованию"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT id FROM MaterialTypes ORDER BY name, id')
+        return [None] + [row[0] for row in cursor.fetchall()]
+
+    def get_materials_by_ids(self, material_ids, search=None, type_id=None):
+        """Текущие строки материалов из списка, подходящие под отбор списка материалов"""
+        source = 'Materials m LEFT JOIN MaterialSummary s ON s.material_id = m.id'
+        conditions = [f"m.id IN ({','.join('?' * len(material_ids))})"]
+        params = list(material_ids)
+        if type_id is not None:
+            conditions.append('m.type_id = ?')
+            params.append(type_id)
+        if search and search.strip():
+            conditions.append('m.id IN (SELECT rowid FROM MaterialsSearch WHERE MaterialsSearch MATCH ?)')
+            params.append(self.search_expression(search))
+        return self.select_materials(source, conditions, params, 'm.id', len(material_ids))
+
+    def get_change_seq(self):
+        """Номер последней записи журнала изменений"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM ChangeLog')
+        return cursor.fetchone()[0]
+
+    def get_changes(self, after_seq, limit=MAX_INCREMENTAL_CHANGES):
+        """Материалы, измененные после записи журнала after_seq: (номер последней записи, [id]).
+
+        None - список нужно перечитать целиком: изменений больше limit,
+        была полная перезагрузка или журнал уже очищен дальше after_seq.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT seq, material_id, operation FROM ChangeLog WHERE seq > ? ORDER BY seq LIMIT ?',
+                       (after_seq, limit + 1))
+        rows = cursor.fetchall()
+        if not rows:
+            return after_seq, []
+        if len(rows) > limit or rows[0][0] != after_seq + 1 or any(row[2] == 'R' for row in rows):
+            return None
+        return rows[-1][0], list(dict.fromkeys(row[1] for row in rows))
+
+    def read_changes(self, after_seq, search=None, type_id=None):
+        """get_changes вместе с текущими строками измененных материалов: (seq, [id], строки)"""
+        changes = self.get_changes(after_seq)
+        if changes is None:
+            return None
+        seq, material_ids = changes
+        rows = self.get_materials_by_ids(material_ids, search, type_id) if material_ids else []
+        return seq, material_ids, rows
+
+    def open_snapshot(self):
+        """Снимок списка материалов, если он есть и его можно догнать по журналу изменений.
+
+        Журнал ChangeLog покрывает все, что показывает снимок: материалы, их потребность
+        (связи с продукцией) и наименования типов (маркер 'R', миграция 9).
+        Снимки прежних версий схемы отбрасываются по schema_version.
+        """
+        snapshot = Snapshot.open(snapshot_path(connection.DB_PATH))
+        if snapshot is None:
+            return None
+        if snapshot.schema_version != get_version(self.conn) or snapshot.change_seq > self.get_change_seq():
+            # Другая схема или база старше снимка (например, восстановлена из копии)
+            snapshot.close()
+            return None
+        return snapshot
+
+    def save_snapshot(self):
+        """Сохранить снимок списка материалов; номер журнала и строки читаются в одной транзакции"""
+        import exporter
+
+        cursor = self.conn.cursor()
+        cursor.execute('BEGIN')
+        try:
+            seq = self.get_change_seq()
+            cursor.execute("""
+                           SELECT m.id,
+                                  m.name,
+                                  mt.name                         AS type_name,
+                                  m.stock_quantity,
+                                  m.min_quantity,
+                                  COALESCE(s.total_required, 0)   AS required_qty,
+                                  mt.id                           AS type_id
+                           FROM Materials m
+                                    LEFT JOIN MaterialTypes mt ON m.type_id = mt.id
+                                    LEFT JOIN MaterialSummary s ON s.material_id = m.id
+                           ORDER BY m.id
+                           """)
+            rows = exporter.iter_cursor(cursor)
+            return write_snapshot(snapshot_path(connection.DB_PATH), rows, seq, get_version(self.conn))
+        finally:
+            self.conn.commit()
+
+    def get_material_types(self):
+        return self.calculator.material_types()
+
     def get_material_by_id(self, material_id):
         query = "SELECT * FROM Materials WHERE id = ?"
         cursor = self.conn.cursor()
         cursor.execute(query, (material_id,))
         return cursor.fetchone()
 
+    @staticmethod
+    def execute_save(cursor, material_id, data):
+        if material_id:
+            query = """
+                    UPDATE Materials
+                    SET name             = ?,
+                        type_id          = ?,
+                        unit_price       = ?,
+                        stock_quantity   = ?,
+                        min_quantity     = ?,
+                        package_quantity = ?,
+                        unit_of_measure  = ?
+                    WHERE id = ?
+                    """
+            cursor.execute(query, (*data, material_id))
+            if cursor.rowcount == 0:
+                raise sqlite3.IntegrityError("материал удален")
+        else:
+            query = """
+                    INSERT INTO Materials
+                    (name, type_id, unit_price, stock_quantity,
+                     min_quantity, package_quantity, unit_of_measure)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """
+            cursor.execute(query, data)
+
+    def write_materials(self, edits):
+        """Пачка правок [(material_id или None для нового, данные)] одной транзакцией.
+
+        Правка, которую база отклоняет, откатывается отдельно (SAVEPOINT),
+        остальные записываются. Возвращает [(номер правки, сообщение)] отклоненных.
+        """
+        cursor = self.conn.cursor()
+        rejected = []
+        cursor.execute('BEGIN')
+        try:
+            for index, (material_id, data) in enumerate(edits):
+                cursor.execute('SAVEPOINT material_edit')
+                try:
+                    self.execute_save(cursor, material_id, data)
+                except sqlite3.IntegrityError as e:
+                    cursor.execute('ROLLBACK TO material_edit')
+                    rejected.append((index, str(e)))
+                cursor.execute('RELEASE material_edit')
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return rejected
+
     def save_material(self, material_id, data):
         try:
-            cursor = self.conn.cursor()
-            if material_id:
-                query = """
-                        UPDATE Materials
-                        SET name             = ?,
-                            type_id          = ?,
-                            unit_price       = ?,
-                            stock_quantity   = ?,
-                            min_quantity     = ?,
-                            package_quantity = ?,
-                            unit_of_measure  = ?
-                        WHERE id = ?
-                        """
-                cursor.execute(query, (*data, material_id))
-            else:
-                query = """
-                        INSERT INTO Materials
-                        (name, type_id, unit_price, stock_quantity,
-                         min_quantity, package_quantity, unit_of_measure)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                        """
-                cursor.execute(query, data)
+            self.execute_save(self.conn.cursor(), material_id, data)
             self.conn.commit()
+            self.changes += 1
             return True
         except Exception as e:
             QMessageBox.critical(None, "Ошибка", f"Ошибка сохранения: {str(e)}")
             return False
 
+    def get_adjacency(self):
+        """Индекс связей материал <-> продукция, общий для GUI и рабочих потоков;
+        перестраивается только после изменения продукции, состава или коэффициентов типов"""
+        from adjacency import shared_index
+        return shared_index(self.conn)
+
     def get_products_by_material(self, material_id):
-        query = """
-                SELECT p.name, pm.required_quantity, pt.coefficient
-                FROM Products p
-                         JOIN ProductMaterials pm ON p.id = pm.product_id
-                         JOIN ProductTypes pt ON p.type_id = pt.id
-                WHERE pm.material_id = ?
-                """
+        return self.get_adjacency().products_by_material(material_id)
+
+    def get_purchase_plan(self):
+        from purchasing import PurchasePlan
+        return PurchasePlan(self.conn)
+
+    def get_capacity_engine(self):
+        """Индекс производственных возможностей.
+
+        Материалы, измененные после построения индекса (любым соединением, в том
+        числе WriteBehindQueue), берутся из журнала ChangeLog: пересчитывается только
+        зависящая от них продукция. Индекс строится заново после изменения связей
+        (счетчик 'links') или когда журнал требует перечитать все (get_changes -> None).
+        """
+        from adjacency import links_version
+        from capacity import CapacityEngine
+
         cursor = self.conn.cursor()
-        cursor.execute(query, (material_id,))
-        return cursor.fetchall()
+        cursor.execute('BEGIN')
+        try:
+            links = links_version(self.conn)
+            changes = None
+            if self.capacity is not None and self.capacity_links == links:
+                changes = self.get_changes(self.capacity_seq)
+            if changes is None:
+                seq = self.get_change_seq()
+                self.capacity = CapacityEngine(self.conn)
+            else:
+                seq, material_ids = changes
+                for material_id in material_ids:
+                    self.capacity.refresh_material(material_id)
+            self.capacity_seq, self.capacity_links = seq, links
+        finally:
+            self.conn.commit()
+        return self.capacity
 
     def calculate_product_quantity(self, product_type_id, material_type_id, raw_quantity, param1, param2):
         """Расчет количества продукции из сырья с учетом потерь"""
-        try:
-            cursor = self.conn.cursor()
+        return self.calculator.quantity(product_type_id, material_type_id, raw_quantity, param1, param2)
 
-            cursor.execute('SELECT coefficient FROM ProductTypes WHERE id = ?', (product_type_id,))
-            product_coeff = cursor.fetchone()[0]
+    def calculate_product_quantities(self, product_type_ids, material_type_ids, raw_quantities, param1, param2):
+        """Пакетный расчет по справочникам в памяти, одним проходом NumPy"""
+        return self.calculator.quantities(product_type_ids, material_type_ids, raw_quantities, param1, param2)
 
-            cursor.execute('SELECT loss_percentage FROM MaterialTypes WHERE id = ?', (material_type_id,))
-            loss_percent = cursor.fetchone()[0]
 
-            raw_per_unit = param1 * param2 * product_coeff
-            effective_raw = raw_quantity * (1 - loss_percent / 100)
-            product_quantity = effective_raw / raw_per_unit
+@lru_cache(maxsize=None)
+def app_icon():
+    """Иконка окон; файл читается один раз на процесс"""
+    return QIcon(ICON_PATH)
 
-            return int(product_quantity) if product_quantity >= 0 else -1
-        except Exception as e:
-            print(f"Ошибка расчета: {e}")
-            return -1
+
+@lru_cache(maxsize=None)
+def logo_pixmap(size):
+    return QPixmap(LOGO_PATH).scaled(size, size, Qt.AspectRatioMode.KeepAspectRatio)
+
+
+def format_number(value):
+    """Отображение числа без лишнего '.0' у целых значений"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+# Период проверки журнала изменений, мс
+CHANGES_POLL_MS = 2000
 
 
-class MaterialModel(QStandardItemModel):
-    def __init__(self, data, headers, parent=None):
+class MaterialModel(QAbstractTableModel):
+    """Виртуальная модель списка материалов с постраничной подгрузкой из SQLite.
+
+    Данные хранятся по столбцам в типизированных массивах, строки
+    формируются только для видимых ячеек.
+    """
+    PAGE_SIZE = 500
+
+    # Столбцы таблицы: имя атрибута с данными для каждого столбца
+    COLUMNS = ['names', 'type_names', 'stock', 'min_qty', 'required']
+
+    def __init__(self, db, headers, parent=None, runner=None):
         super().__init__(parent)
-        self.setHorizontalHeaderLabels(headers)
-        self.load_data(data)
+        self.db = db
+        # Если задан исполнитель, страницы загружаются в фоне
+        self.runner = runner
+        self.headers = headers
+        self.search = None
+        self.type_id = None
+        # Сортировка выполняется в SQLite; None - по id
+        self.sort_column = None
+        self.descending = False
+        self.type_ranks = {}
+        self.change_seq = 0
+        # Правки из очереди записи, еще не попавшие в базу: id -> строка; они
+        # перекрывают строки, прочитанные из базы
+        self.pending_edits = {}
+        self.clear()
+
+    def clear(self):
+        if self.runner is not None:
+            # Страницы и изменения, запрошенные для прежнего содержимого, уже не нужны
+            self.runner.cancel('materials_page')
+            self.runner.cancel('materials_changes')
+        self.ids = array('q')
+        self.names = []
+        self.type_names = []
+        self.stock = array('d')
+        self.min_qty = array('d')
+        self.required = array('d')
+        self.type_ids = array('q')
+        # id -> номер строки; строится при первом обращении после вставки или удаления
+        self.positions = None
+        self.exhausted = False
+        self.fetching = False
 
-    def load_data(self, data):
-        self.setRowCount(0)
-        for row_data in data:
-            row_items = []
-            for item in row_data[1:-1]:  # Пропускаем ID и type_id
-                cell = QStandardItem(str(item))
-                cell.setEditable(False)
-                row_items.append(cell)
-            self.appendRow(row_items)
+    def load_data(self):
+        self.beginResetModel()
+        self.clear()
+        # Изменения, сделанные после этой записи журнала, применяются через apply_changes
+        self.change_seq = self.db.get_change_seq()
+        if self.sort_column == DatabaseManager.TYPE_COLUMN:
+            self.type_ranks = {type_id: rank for rank, type_id in enumerate(self.db.get_type_groups())}
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def load_snapshot(self, snapshot):
+        """Весь список из снимка на диске (порядок по id, без отбора); журнал - с номера снимка"""
+        self.beginResetModel()
+        self.clear()
+        self.search = None
+        self.type_id = None
+        self.sort_column = None
+        self.descending = False
+        for name, values in snapshot.columns().items():
+            setattr(self, name, values)
+        self.names = snapshot.names()
+        self.type_names = snapshot.type_names()
+        self.exhausted = True
+        self.change_seq = snapshot.change_seq
+        self.endResetModel()
+        instrumentation.startup_mark('first_data')
+
+    def refresh_changes(self):
+        """Применить изменения из журнала; при большом отставании модель перечитывается"""
+        after_seq = self.change_seq
+        if self.runner is None:
+            self.apply_log(self.db.read_changes(after_seq, self.search, self.type_id), after_seq)
+            return
+        self.runner.submit('materials_changes', 'read_changes', (after_seq, self.search, self.type_id),
+                           lambda changes: self.apply_log(changes, after_seq))
+
+    def apply_log(self, changes, after_seq):
+        # Модель перечитана, пока шел запрос: результат к ней уже не относится
+        if after_seq != self.change_seq:
+            return
+        if changes is None:
+            self.load_data()
+            return
+        self.change_seq, material_ids, rows = changes
+        if material_ids:
+            self.apply_changes(material_ids, rows)
+
+    def apply_changes(self, material_ids, rows):
+        """Точечное обновление модели: rows - текущие строки измененных материалов,
+        подходящие под отбор; материалов из material_ids без строки больше нет в списке"""
+        fresh = {row[0]: row for row in self.overlay(rows)}
+        for material_id in material_ids:
+            pos = self.position(material_id)
+            row = fresh.get(material_id)
+            if pos is None:
+                if row is not None:
+                    self.insert_row(row)
+            elif row is None:
+                self.remove_row(pos)
+            else:
+                self.update_row(pos, row)
+
+    def overlay(self, rows):
+        if not self.pending_edits:
+            return rows
+        return [self.pending_edits.get(row[0], row) for row in rows]
+
+    def apply_edit(self, material_id, row):
+        """Показать правку сразу, до записи в базу"""
+        self.pending_edits[material_id] = row
+        pos = self.position(material_id)
+        if pos is not None:
+            self.update_row(pos, row)
+
+    def reload_rows(self, material_ids):
+        """Перечитать строки из базы, например после отклоненной правки"""
+        self.apply_changes(material_ids, self.db.get_materials_by_ids(material_ids, self.search, self.type_id))
+
+    def position(self, material_id):
+        if self.positions is None:
+            self.positions = {material_id: row for row, material_id in enumerate(self.ids)}
+        return self.positions.get(material_id)
+
+    def sort_key(self, row):
+        """Ключ строки (в формате row_data) в порядке ORDER BY запроса страниц"""
+        if self.sort_column is None:
+            return (row[0],)
+        if self.sort_column == DatabaseManager.TYPE_COLUMN:
+            return (self.type_ranks.get(row[6], -1), row[0])
+        return (row[self.sort_column + 1], row[0])
+
+    def insert_position(self, key, skip=None):
+        """Номер строки для ключа key (двоичный поиск); skip - строка, которая не учитывается"""
+        low, high = 0, len(self.ids) - (skip is not None)
+        while low < high:
+            middle = (low + high) // 2
+            other = self.sort_key(self.row_data(middle if skip is None or middle < skip else middle + 1))
+            if (other > key) if self.descending else (other < key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def store_row(self, pos, row):
+        material_id, name, type_name, stock, min_qty, required, type_id = row
+        self.ids.insert(pos, material_id)
+        self.names.insert(pos, name)
+        self.type_names.insert(pos, type_name or "")
+        self.stock.insert(pos, stock)
+        self.min_qty.insert(pos, min_qty)
+        self.required.insert(pos, required)
+        self.type_ids.insert(pos, type_id or 0)
+
+    def delete_row(self, pos):
+        for column in (self.ids, self.names, self.type_names, self.stock, self.min_qty, self.required,
+                       self.type_ids):
+            del column[pos]
+
+    def insert_row(self, row):
+        pos = self.insert_position(self.sort_key(row))
+        # Строка за последней загруженной придет со следующей страницей
+        if pos == len(self.ids) and not self.exhausted:
+            return
+        self.beginInsertRows(QModelIndex(), pos, pos)
+        self.store_row(pos, row)
+        self.positions = None
+        self.endInsertRows()
+
+    def remove_row(self, pos):
+        self.beginRemoveRows(QModelIndex(), pos, pos)
+        self.delete_row(pos)
+        self.positions = None
+        self.endRemoveRows()
+
+    def update_row(self, pos, row):
+        target = self.insert_position(self.sort_key(row), skip=pos)
+        if target == len(self.ids) - 1 and not self.exhausted:
+            self.remove_row(pos)
+            return
+        if target != pos:
+            # Перемещение сохраняет выделение строки, в отличие от удаления и вставки
+            self.beginMoveRows(QModelIndex(), pos, pos, QModelIndex(), target if target < pos else target + 1)
+            self.delete_row(pos)
+            self.store_row(target, row)
+            self.positions = None
+            self.endMoveRows()
+        else:
+            self.delete_row(pos)
+            self.store_row(pos, row)
+        self.dataChanged.emit(self.index(target, 0), self.index(target, len(self.COLUMNS) - 1))
+
+    def set_filter(self, search=None, type_id=None):
+        """Отбор выполняется в SQLite: в модель попадают только подходящие строки"""
+        self.search = search
+        self.type_id = type_id
+        self.load_data()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """Сортировка на стороне базы: модель перечитывается с первой страницы.
+
+        Прежний порядок не перечитывается: setSortingEnabled вызывает sort
+        еще до первой загрузки списка (MainWindow.open_materials).
+        """
+        sort_column = column if column >= 0 else None
+        descending = sort_column is not None and order == Qt.SortOrder.DescendingOrder
+        if (sort_column, descending) == (self.sort_column, self.descending):
+            return
+        self.sort_column = sort_column
+        self.descending = descending
+        self.load_data()
+
+    def after_value(self):
+        """Значение ключа сортировки последней загруженной строки"""
+        if self.sort_column is None or not self.ids:
+            return None
+        if self.sort_column == DatabaseManager.TYPE_COLUMN:
+            return self.type_ids[-1] or None
+        return getattr(self, self.COLUMNS[self.sort_column])[-1]
+
+    def page_args(self):
+        after_id = self.ids[-1] if self.ids else 0
+        return (after_id, self.PAGE_SIZE, self.search, self.type_id,
+                self.sort_column, self.descending, self.after_value())
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted and not self.fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted or self.fetching:
+            return
+        if self.runner is None:
+            self.append_rows(self.db.get_materials_page(*self.page_args()))
+            return
+        # Новый запрос с тем же ключом отменяет незавершенный (например, после сброса модели)
+        self.fetching = True
+        self.runner.submit('materials_page', 'get_materials_page', self.page_args(),
+                           self.append_rows, self.fetch_failed)
+
+    def fetch_failed(self, message):
+        self.fetching = False
+
+    def append_rows(self, rows):
+        self.fetching = False
+        instrumentation.startup_mark('first_data')
+        if len(rows) < self.PAGE_SIZE:
+            self.exhausted = True
+        if not rows:
+            return
+
+        first = len(self.ids)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.positions = None
+        for material_id, name, type_name, stock, min_qty, required, type_id in self.overlay(rows):
+            self.ids.append(material_id)
+            self.names.append(name)
+            self.type_names.append(type_name or "")
+            self.stock.append(stock)
+            self.min_qty.append(min_qty)
+            self.required.append(required)
+            self.type_ids.append(type_id or 0)
+        self.endInsertRows()
+
+    def material_id(self, row):
+        return self.ids[row]
+
+    def row_data(self, row):
+        """Строка в формате get_materials(): (id, name, type_name, stock, min, required, type_id)"""
+        return (self.ids[row], self.names[row], self.type_names[row], self.stock[row],
+                self.min_qty[row], self.required[row], self.type_ids[row] or None)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        value = getattr(self, self.COLUMNS[index.column()])[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return format_number(value) if isinstance(value, float) else value
+        if role == Qt.ItemDataRole.UserRole:
+            # Исходное значение для сортировки и расчетов
+            return value
+        if role == Qt.ItemDataRole.TextAlignmentRole and isinstance(value, float):
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def flags(self, index):
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+
+
+class PlanModel(QAbstractTableModel):
+    """Строки расчета (PurchasePlan, CapacityEngine); значения читаются из его массивов по запросу ячейки"""
+
+    def __init__(self, plan, parent=None):
+        super().__init__(parent)
+        self.plan = plan
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.plan)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.plan.HEADERS)
+
+    def value(self, row, column):
+        return self.plan.row(row)[column]
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            value = self.value(index.row(), index.column())
+            return format_number(value) if isinstance(value, float) else value
+        if role == Qt.ItemDataRole.TextAlignmentRole and isinstance(self.value(index.row(), index.column()),
+                                                                    (int, float)):
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.plan.HEADERS[section]
+        return None
 
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Управление материалами")
-        self.setWindowIcon(QIcon('Образ плюс.ico'))
+        self.setWindowIcon(app_icon())
         self.setGeometry(100, 100, 1000, 600)
         self.setStyleSheet(APP_STYLE)
         self.db = DatabaseManager()
+        self.runner = AsyncQueryRunner(DatabaseManager, self)
+        self.runner.busy_changed.connect(self.set_loading)
+        self.runner.failed.connect(self.show_query_error)
+        # Правки материалов пишутся в фоне пачками; id -> число правок в очереди
+        # Правки пользователя записываются с synchronous=FULL (профиль 'safe')
+        self.writer = WriteBehindQueue(lambda: DatabaseManager('safe'), self)
+        self.writer.written.connect(self.edits_written)
+        self.writer.failed.connect(self.edits_failed)
+        QApplication.instance().aboutToQuit.connect(self.writer.close)
+        self.unsaved = Counter()
+        # id -> данные последней правки в очереди: окно редактирования показывает их, а не базу
+        self.unsaved_data = {}
+        # Диалоги создаются при первом открытии и дальше переиспользуются
+        self.edit_dialog = None
+        self.products_dialog = None
+        self.purchase_dialog = None
+        self.capacity_dialog = None
         self.init_ui()
-        self.load_materials()
+        self.open_materials()
 
     def init_ui(self):
         central_widget = QWidget()
@@ -177,8 +860,7 @@ class MainWindow(QMainWindow):
         # Заголовок с логотипом
         header_layout = QHBoxLayout()
         logo_label = QLabel()
-        logo_pixmap = QPixmap('Образ плюс.png').scaled(40, 40, Qt.AspectRatioMode.KeepAspectRatio)
-        logo_label.setPixmap(logo_pixmap)
+        logo_label.setPixmap(logo_pixmap(40))
         header_layout.addWidget(logo_label)
         title_label = QLabel("Образ Плюс - Управление материалами")
         title_label.setStyleSheet("font-size: 16px; font-weight: bold; color: #1D476B;")
@@ -186,11 +868,37 @@ class MainWindow(QMainWindow):
         header_layout.addStretch()
         layout.addLayout(header_layout)
 
+        # Поиск и фильтр по типу материала
+        filter_layout = QHBoxLayout()
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Поиск по наименованию или единице измерения")
+        self.search_edit.textChanged.connect(self.schedule_filter)
+        filter_layout.addWidget(self.search_edit)
+        self.type_filter = QComboBox()
+        self.type_filter.addItem("Все типы", None)
+        for type_id, type_name in self.db.get_material_types():
+            self.type_filter.addItem(type_name, type_id)
+        self.type_filter.currentIndexChanged.connect(self.apply_filter)
+        filter_layout.addWidget(self.type_filter)
+        layout.addLayout(filter_layout)
+
+        # Запрос выполняется после паузы в наборе текста, а не на каждое нажатие
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(300)
+        self.filter_timer.timeout.connect(self.apply_filter)
+
         # Таблица материалов
         self.table = QTableView()
         self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
         self.table.doubleClicked.connect(self.edit_material)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        headers = ["Материал", "Тип материала", "На складе", "Мин. кол-во", "Требуется"]
+        self.model = MaterialModel(self.db, headers, runner=self.runner)
+        self.table.setModel(self.model)
+        # Щелчок по заголовку сортирует в базе (MaterialModel.sort); до первого щелчка - по id
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.table.setSortingEnabled(True)
 
         # Включаем контекстное меню
         self.table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
@@ -206,8 +914,66 @@ class MainWindow(QMainWindow):
         refresh_btn = QPushButton("Обновить")
         refresh_btn.clicked.connect(self.load_materials)
         btn_layout.addWidget(refresh_btn)
+        purchase_btn = QPushButton("План закупок")
+        purchase_btn.clicked.connect(self.show_purchase_plan)
+        btn_layout.addWidget(purchase_btn)
+        capacity_btn = QPushButton("Возможности производства")
+        capacity_btn.clicked.connect(self.show_capacity)
+        btn_layout.addWidget(capacity_btn)
+        export_btn = QPushButton("Экспорт списка")
+        export_btn.clicked.connect(self.export_materials)
+        btn_layout.addWidget(export_btn)
+        backup_btn = QPushButton("Выгрузить все данные")
+        backup_btn.clicked.connect(self.export_tables)
+        btn_layout.addWidget(backup_btn)
         layout.addLayout(btn_layout)
 
+        # Изменения из других окон и программ (например, импорта) подхватываются по журналу
+        self.seen_version = self.db.data_version()
+        self.changes_timer = QTimer(self)
+        self.changes_timer.timeout.connect(self.poll_changes)
+        self.changes_timer.start(CHANGES_POLL_MS)
+
+        # Счетчики запросов в строке состояния, только при включенной трассировке
+        if instrumentation.enabled:
+            self.stats_label = QLabel()
+            self.statusBar().addPermanentWidget(self.stats_label)
+            self.stats_timer = QTimer(self)
+            self.stats_timer.timeout.connect(self.update_query_stats)
+            self.stats_timer.start(1000)
+            self.update_query_stats()
+
+    def update_query_stats(self):
+        queries, total_ms, slow = instrumentation.summary()
+        self.stats_label.setText(f"Запросов: {queries}, время: {total_ms:.0f} мс, медленных: {slow}")
+
+    def schedule_filter(self):
+        self.filter_timer.start()
+
+    def apply_filter(self):
+        self.filter_timer.stop()
+        self.model.set_filter(self.search_edit.text().strip() or None, self.type_filter.currentData())
+
+    def set_loading(self, loading):
+        if loading:
+            self.statusBar().showMessage("Загрузка...")
+        else:
+            self.statusBar().clearMessage()
+
+    def show_query_error(self, key, message):
+        self.statusBar().showMessage(f"Ошибка загрузки данных: {message}", 5000)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        instrumentation.startup_mark('first_paint')
+
+    def closeEvent(self, event):
+        # Все правки из очереди записываются до выхода; ошибки записи показываются сразу
+        self.writer.close()
+        QApplication.sendPostedEvents()
+        self.runner.shutdown()
+        super().closeEvent(event)
+
     def show_context_menu(self, position):
         menu = QMenu()
         view_products_action = QAction("Просмотреть продукцию", self)
@@ -219,7 +985,7 @@ class MainWindow(QMainWindow):
         selected = self.table.selectionModel().selectedRows()
         if selected:
             row = selected[0].row()
-            material_data = self.db.get_materials()[row]
+            material_data = self.model.row_data(row)
             material_id = material_data[0]
             material_name = material_data[1]
 
@@ -227,41 +993,161 @@ class MainWindow(QMainWindow):
             material_type_id = material_data[-1]  # Последний элемент - type_id
             stock_quantity = material_data[3]
 
-            dialog = ProductListDialog(self.db, material_id, material_name, material_type_id, stock_quantity)
-            dialog.exec()
+            if self.products_dialog is None:
+                self.products_dialog = ProductListDialog(self.db, material_id, material_name, material_type_id,
+                                                         stock_quantity, self.runner)
+            else:
+                self.products_dialog.set_material(material_id, material_name, material_type_id, stock_quantity)
+            self.products_dialog.exec()
+
+    def show_purchase_plan(self):
+        if self.purchase_dialog is None:
+            self.purchase_dialog = PurchasePlanDialog(self.db, self.runner)
+        else:
+            self.purchase_dialog.load_data()
+        self.purchase_dialog.exec()
+
+    def show_capacity(self):
+        if self.capacity_dialog is None:
+            self.capacity_dialog = CapacityDialog(self.db, self.runner)
+        else:
+            self.capacity_dialog.load_data()
+        self.capacity_dialog.exec()
 
     def load_materials(self):
-        data = self.db.get_materials()
-        headers = ["Материал", "Тип материала", "На складе", "Мин. кол-во", "Требуется"]
-        self.model = MaterialModel(data, headers)
-        self.table.setModel(self.model)
+        self.model.load_data()
 
-    def add_material(self):
-        dialog = MaterialEditDialog(self.db)
-        if dialog.exec() == QDialog.DialogCode.Accepted:
+    def open_materials(self):
+        """Первый показ списка: из снимка на диске, если он есть, иначе постранично из базы"""
+        snapshot = self.db.open_snapshot()
+        if snapshot is None:
             self.load_materials()
+            self.runner.submit('snapshot', 'save_snapshot')
+            return
+        try:
+            self.model.load_snapshot(snapshot)
+        finally:
+            snapshot.close()
+        # Сверка с базой в фоне: изменения после сохранения снимка берутся из журнала,
+        # а устаревший снимок пересохраняется для следующего запуска
+        self.refresh_changes()
+        if snapshot.change_seq != self.db.get_change_seq():
+            self.runner.submit('snapshot', 'save_snapshot')
+
+    def export_materials(self):
+        """Выгрузка списка с текущими отбором и сортировкой; выполняется в фоне"""
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт списка материалов", "Материалы.xlsx",
+                                              "Excel (*.xlsx);;CSV (*.csv)")
+        if not path:
+            return
+        model = self.model
+        self.runner.submit('export', 'export_materials',
+                           (path, model.headers, model.search, model.type_id, model.sort_column, model.descending),
+                           lambda count: self.statusBar().showMessage(f"Выгружено строк: {count}", 5000))
+
+    def export_tables(self):
+        """Все таблицы в файлы формата импорта: резервная копия или перенос данных"""
+        directory = QFileDialog.getExistingDirectory(self, "Папка для выгрузки данных")
+        if not directory:
+            return
+        self.runner.submit('export', 'export_tables', (directory,),
+                           lambda files: self.statusBar().showMessage(f"Данные выгружены в {directory}", 5000))
+
+    def refresh_changes(self):
+        """Обновить только измененные строки, сохранив выделение и прокрутку"""
+        self.seen_version = self.db.data_version()
+        self.model.refresh_changes()
+
+    def poll_changes(self):
+        # PRAGMA data_version не меняется, пока в базу никто не писал
+        if self.db.data_version() != self.seen_version:
+            self.refresh_changes()
+
+    def material_dialog(self, material_id=None):
+        if self.edit_dialog is None:
+            self.edit_dialog = MaterialEditDialog(self.db, material_id, save=self.queue_edit,
+                                                  pending=self.unsaved_data.get)
+        else:
+            self.edit_dialog.set_material(material_id)
+        return self.edit_dialog
+
+    def add_material(self):
+        self.material_dialog().exec()
 
     def edit_material(self, index):
-        material_id = self.db.get_materials()[index.row()][0]
-        dialog = MaterialEditDialog(self.db, material_id)
-        if dialog.exec() == QDialog.DialogCode.Accepted:
-            self.load_materials()
+        material_id = self.model.material_id(index.row())
+        self.material_dialog(material_id).exec()
+
+    def queue_edit(self, material_id, data):
+        """Правка сразу видна в таблице, а в базу попадает пачкой через очередь записи"""
+        self.writer.submit(material_id, data)
+        # Новый материал появится в списке после записи, по журналу изменений
+        if material_id is None:
+            return
+        self.unsaved[material_id] += 1
+        self.unsaved_data[material_id] = data
+        pos = self.model.position(material_id)
+        if pos is not None:
+            name, type_id, _, stock_quantity, min_quantity, _, _ = data
+            type_name = dict(self.db.get_material_types()).get(type_id, "")
+            self.model.apply_edit(material_id, (material_id, name, type_name, stock_quantity, min_quantity,
+                                                self.model.required[pos], type_id))
+
+    def settle_edit(self, material_id):
+        if material_id is None:
+            return
+        self.unsaved[material_id] -= 1
+        if self.unsaved[material_id] <= 0:
+            del self.unsaved[material_id]
+            del self.unsaved_data[material_id]
+            self.model.pending_edits.pop(material_id, None)
+
+    def edits_written(self, material_ids):
+        for material_id in material_ids:
+            self.settle_edit(material_id)
+        self.refresh_changes()
+
+    def edits_failed(self, failures):
+        for material_id, _, _ in failures:
+            self.settle_edit(material_id)
+        # В таблице остались значения отклоненных правок: возвращаем строки из базы
+        self.model.reload_rows([material_id for material_id, _, _ in failures if material_id is not None])
+        lines = [f"{data[0]}: {' '.join(message.split())}" for _, data, message in failures]
+        QMessageBox.critical(self, "Ошибка", "Не сохранены изменения материалов:\n" + "\n".join(lines))
 
 
 class MaterialEditDialog(QDialog):
-    def __init__(self, db, material_id=None):
+    def __init__(self, db, material_id=None, save=None, pending=None):
         super().__init__()
         self.db = db
-        self.material_id = material_id
-        self.setWindowIcon(QIcon('Образ плюс.ico'))
-        title = "Редактирование материала" if material_id else "Новый материал"
-        self.setWindowTitle(title)
+        # save(material_id, данные) вместо немедленной записи через db.save_material
+        self.save = save
+        # pending(material_id) - данные правки, еще не записанной в базу, или None
+        self.pending = pending
+        self.setWindowIcon(app_icon())
         self.setModal(True)
         self.setFixedSize(400, 350)
         self.init_ui()
+        self.set_material(material_id)
+
+    def set_material(self, material_id):
+        """Подготовить окно к редактированию материала или вводу нового (material_id=None)"""
+        self.material_id = material_id
+        self.setWindowTitle("Редактирование материала" if material_id else "Новый материал")
+        self.load_types()
+        for edit in (self.name_edit, self.price_edit, self.stock_edit, self.min_edit, self.package_edit,
+                     self.unit_edit):
+            edit.clear()
+        self.name_edit.setFocus()
         if material_id:
             self.load_data()
 
+    def load_types(self):
+        # Типы берутся из справочника в памяти; после импорта он перечитывается сам (calculator.py)
+        self.type_combo.clear()
+        for type_id, type_name in self.db.get_material_types():
+            self.type_combo.addItem(type_name, type_id)
+
     def init_ui(self):
         layout = QFormLayout(self)
         self.name_edit = QLineEdit()
@@ -272,10 +1158,6 @@ class MaterialEditDialog(QDialog):
         self.package_edit = QLineEdit()
         self.unit_edit = QLineEdit()
 
-        types = self.db.get_material_types()
-        for type_id, type_name in types:
-            self.type_combo.addItem(type_name, type_id)
-
         layout.addRow("Наименование:", self.name_edit)
         layout.addRow("Тип материала:", self.type_combo)
         layout.addRow("Цена единицы:", self.price_edit)
@@ -294,18 +1176,24 @@ class MaterialEditDialog(QDialog):
         layout.addRow(btn_layout)
 
     def load_data(self):
-        material = self.db.get_material_by_id(self.material_id)
-        if material:
-            self.name_edit.setText(material[1])
-            for index in range(self.type_combo.count()):
-                if self.type_combo.itemData(index) == material[2]:
-                    self.type_combo.setCurrentIndex(index)
-                    break
-            self.price_edit.setText(str(material[3]))
-            self.stock_edit.setText(str(material[4]))
-            self.min_edit.setText(str(material[5]))
-            self.package_edit.setText(str(material[6]))
-            self.unit_edit.setText(material[7])
+        # Правка из очереди записи новее строки в базе: иначе сохранение окна отменило бы ее
+        material = self.pending(self.material_id) if self.pending else None
+        if material is None:
+            material = self.db.get_material_by_id(self.material_id)
+            if not material:
+                return
+            material = material[1:]
+        name, type_id, unit_price, stock_quantity, min_quantity, package_quantity, unit_of_measure = material
+        self.name_edit.setText(name)
+        for index in range(self.type_combo.count()):
+            if self.type_combo.itemData(index) == type_id:
+                self.type_combo.setCurrentIndex(index)
+                break
+        self.price_edit.setText(str(unit_price))
+        self.stock_edit.setText(str(stock_quantity))
+        self.min_edit.setText(str(min_quantity))
+        self.package_edit.setText(str(package_quantity))
+        self.unit_edit.setText(unit_of_measure)
 
     def save_material(self):
         try:
@@ -337,18 +1225,19 @@ class MaterialEditDialog(QDialog):
             package_quantity, unit_of_measure
         )
 
-        if self.db.save_material(self.material_id, data):
+        if self.save is not None:
+            self.save(self.material_id, data)
+            self.accept()
+        elif self.db.save_material(self.material_id, data):
             self.accept()
 
 
 class ProductListDialog(QDialog):
-    def __init__(self, db, material_id, material_name, material_type_id, stock_quantity):
+    def __init__(self, db, material_id, material_name, material_type_id, stock_quantity, runner=None):
         super().__init__()
         self.db = db
-        self.material_type_id = material_type_id
-        self.stock_quantity = stock_quantity
-        self.setWindowTitle(f"Продукция для: {material_name}")
-        self.setWindowIcon(QIcon('Образ плюс.ico'))
+        self.runner = runner
+        self.setWindowIcon(app_icon())
         self.setFixedSize(800, 500)
 
         layout = QVBoxLayout(self)
@@ -363,25 +1252,67 @@ class ProductListDialog(QDialog):
         params_layout.addWidget(QLabel("Параметр 2:"))
         params_layout.addWidget(self.param2_edit)
 
-        calculate_btn = QPushButton("Рассчитать возможное количество")
-        calculate_btn.clicked.connect(self.calculate_quantities)
+        self.calculate_btn = QPushButton("Рассчитать возможное количество")
+        self.calculate_btn.clicked.connect(self.calculate_quantities)
+        self.status_label = QLabel()
+
+        self.export_btn = QPushButton("Экспорт")
+        self.export_btn.clicked.connect(self.export_products)
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addWidget(self.calculate_btn)
+        buttons_layout.addWidget(self.export_btn)
 
         layout.addLayout(params_layout)
-        layout.addWidget(calculate_btn)
+        layout.addLayout(buttons_layout)
+        layout.addWidget(self.status_label)
 
         # Таблица продукции
         self.table = QTableView()
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         layout.addWidget(self.table)
 
+        self.set_material(material_id, material_name, material_type_id, stock_quantity)
+
+    def set_material(self, material_id, material_name, material_type_id, stock_quantity):
+        """Показать продукцию другого материала в том же окне"""
+        self.material_id = material_id
+        self.material_name = material_name
+        self.material_type_id = material_type_id
+        self.stock_quantity = stock_quantity
+        self.product_type_ids = []
+        # Параметры последнего расчета: с ними выгружается расчетное количество
+        self.calculated_params = None
+        self.setWindowTitle(f"Продукция для: {material_name}")
+        self.table.setModel(None)
         self.load_data(material_id)
 
     def load_data(self, material_id):
-        data = self.db.get_products_by_material(material_id)
+        if self.runner is None:
+            self.show_products(self.db.get_products_by_material(material_id))
+            return
+        self.calculate_btn.setEnabled(False)
+        self.status_label.setText("Загрузка...")
+        self.runner.submit('products_by_material', 'get_products_by_material', (material_id,),
+                           self.show_products, self.show_error)
+
+    def show_error(self, message):
+        self.status_label.setText(f"Ошибка загрузки: {message}")
+
+    def done(self, result):
+        # Результат, пришедший после закрытия окна, не нужен
+        if self.runner is not None:
+            self.runner.cancel('products_by_material')
+        super().done(result)
+
+    def show_products(self, data):
+        self.calculate_btn.setEnabled(True)
+        self.status_label.clear()
         model = QStandardItemModel()
         model.setHorizontalHeaderLabels(["Продукция", "Требуемое количество", "Коэффициент", "Расчетное количество"])
 
-        for product_name, required_qty, coefficient in data:
+        self.product_type_ids = [row[3] for row in data]
+        for product_name, required_qty, coefficient, product_type_id in data:
             row = [
                 QStandardItem(product_name),
                 QStandardItem(str(required_qty)),
@@ -396,36 +1327,179 @@ class ProductListDialog(QDialog):
         try:
             param1 = float(self.param1_edit.text())
             param2 = float(self.param2_edit.text())
+        except ValueError:
+            QMessageBox.warning(self, "Ошибка", "Введите корректные числовые параметры")
+            return
+
+        if not self.product_type_ids:
+            return
+
+        # Расчет для всех строк одним пакетом с типом каждого продукта
+        quantities = self.db.calculate_product_quantities(
+            self.product_type_ids,
+            self.material_type_id,
+            self.stock_quantity,
+            param1,
+            param2
+        )
 
-            model = self.table.model()
-            for row in range(model.rowCount()):
-                product_name = model.item(row, 0).text()
-                required_qty = float(model.item(row, 1).text())
-                product_coeff = float(model.item(row, 2).text())
+        # Обновляем таблицу
+        model = self.table.model()
+        for row, quantity in enumerate(quantities.tolist()):
+            model.setItem(row, 3, QStandardItem(str(quantity)))
+        self.calculated_params = (param1, param2)
+
+    def export_products(self):
+        """Выгрузка продукции материала; выполняется в фоне и не отменяется при закрытии окна"""
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт продукции", f"{self.material_name}.xlsx",
+                                              "Excel (*.xlsx);;CSV (*.csv)")
+        if not path:
+            return
+        param1, param2 = self.calculated_params or (None, None)
+        args = (self.material_id, path, self.stock_quantity, param1, param2)
+        if self.runner is None:
+            try:
+                self.show_exported(self.db.export_products(*args))
+            except OSError as e:
+                self.show_export_error(str(e))
+            return
+        self.status_label.setText("Выгрузка...")
+        self.runner.submit('products_export', 'export_products', args, self.show_exported, self.show_export_error)
 
-                # Получаем product_type_id (здесь упрощенно, в реальности нужно запрашивать из БД)
-                # В реальном приложении нужно добавить запрос к БД для получения product_type_id
-                product_type_id = 1  # Заглушка, нужно реализовать правильный запрос
+    def show_exported(self, count):
+        self.status_label.setText(f"Выгружено строк: {count}")
 
-                # Расчет количества продукции
-                quantity = self.db.calculate_product_quantity(
-                    product_type_id,
-                    self.material_type_id,
-                    self.stock_quantity,
-                    param1,
-                    param2
-                )
+    def show_export_error(self, message):
+        self.status_label.clear()
+        QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл: {message}")
 
-                # Обновляем таблицу
-                model.setItem(row, 3, QStandardItem(str(quantity)))
 
-        except ValueError as e:
-            QMessageBox.warning(self, "Ошибка", "Введите корректные числовые параметры")
+class PurchasePlanDialog(QDialog):
+    def __init__(self, db, runner=None):
+        super().__init__()
+        self.db = db
+        self.runner = runner
+        self.plan = None
+        self.setWindowTitle("План закупок")
+        self.setWindowIcon(app_icon())
+        self.resize(900, 600)
+
+        layout = QVBoxLayout(self)
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        # Материалы, которые нужно докупить
+        self.table = QTableView()
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.table, 3)
+
+        # Итоги по типам материалов
+        self.types_table = QTableView()
+        self.types_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.types_table, 1)
+
+        btn_layout = QHBoxLayout()
+        self.export_btn = QPushButton("Экспорт в CSV")
+        self.export_btn.setEnabled(False)
+        self.export_btn.clicked.connect(self.export_plan)
+        btn_layout.addWidget(self.export_btn)
+        refresh_btn = QPushButton("Пересчитать")
+        refresh_btn.clicked.connect(self.load_data)
+        btn_layout.addWidget(refresh_btn)
+        layout.addLayout(btn_layout)
+
+        self.load_data()
+
+    def load_data(self):
+        if self.runner is None:
+            self.show_plan(self.db.get_purchase_plan())
+            return
+        self.export_btn.setEnabled(False)
+        self.status_label.setText("Расчет...")
+        self.runner.submit('purchase_plan', 'get_purchase_plan', (), self.show_plan, self.show_error)
+
+    def show_error(self, message):
+        self.status_label.setText(f"Ошибка расчета: {message}")
+
+    def done(self, result):
+        if self.runner is not None:
+            self.runner.cancel('purchase_plan')
+        super().done(result)
+
+    def show_plan(self, plan):
+        self.plan = plan
+        self.table.setModel(PlanModel(plan, self.table))
+
+        model = QStandardItemModel()
+        model.setHorizontalHeaderLabels(plan.TYPE_HEADERS)
+        for type_name, count, cost in plan.type_rows():
+            model.appendRow([QStandardItem(type_name), QStandardItem(str(count)),
+                             QStandardItem(format_number(cost))])
+        self.types_table.setModel(model)
+
+        self.status_label.setText(f"Материалов к закупке: {len(plan)}, "
+                                  f"общая стоимость: {format_number(round(plan.total_cost, 2))}")
+        self.export_btn.setEnabled(True)
+
+    def export_plan(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт плана закупок", "План закупок.csv",
+                                              "CSV (*.csv)")
+        if not path:
+            return
+        try:
+            self.plan.write_csv(path)
+        except OSError as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл: {e}")
+
+
+class CapacityDialog(QDialog):
+    """Сколько единиц каждой продукции можно изготовить из текущих остатков"""
+
+    def __init__(self, db, runner=None):
+        super().__init__()
+        self.db = db
+        self.runner = runner
+        self.setWindowTitle("Возможности производства")
+        self.setWindowIcon(app_icon())
+        self.resize(900, 600)
+
+        layout = QVBoxLayout(self)
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        self.table = QTableView()
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.table)
+
+        refresh_btn = QPushButton("Пересчитать")
+        refresh_btn.clicked.connect(self.load_data)
+        layout.addWidget(refresh_btn)
+
+        self.load_data()
+
+    def load_data(self):
+        if self.runner is None:
+            self.show_capacity(self.db.get_capacity_engine())
+            return
+        self.status_label.setText("Расчет...")
+        self.runner.submit('capacity', 'get_capacity_engine', (), self.show_capacity, self.show_error)
+
+    def show_error(self, message):
+        self.status_label.setText(f"Ошибка расчета: {message}")
+
+    def done(self, result):
+        if self.runner is not None:
+            self.runner.cancel('capacity')
+        super().done(result)
+
+    def show_capacity(self, engine):
+        self.table.setModel(PlanModel(engine, self.table))
+        self.status_label.setText(f"Продукции с составом: {len(engine)}")
 
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    app.setWindowIcon(QIcon('Образ плюс.ico'))
+    app.setWindowIcon(app_icon())
     font = QFont("Constantia", 10)
     app.setFont(font)
     window = MainWindow()
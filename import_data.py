@@ -1,76 +1,27 @@
-import pandas as pd
-import sqlite3
+import importer
+from connection import connect
+from migrations import migrate
 
 
-def import_data():
-    conn = sqlite3.connect('obraz_plus.db')
-    cursor = conn.cursor()
-
-    # Create tables if they don't exist (in correct order)
-    cursor.execute("""
-                   CREATE TABLE IF NOT EXISTS MaterialTypes
-                   (
-                       id INTEGER PRIMARY KEY AUTOINCREMENT,
-                       name TEXT NOT NULL,
-                       loss_percentage REAL NOT NULL
-                   )
-                   """)
-
-    cursor.execute("""
-                   CREATE TABLE IF NOT EXISTS Materials
-                   (
-                       id INTEGER PRIMARY KEY AUTOINCREMENT,
-                       name TEXT NOT NULL,
-                       type_id INTEGER,
-                       unit_price REAL NOT NULL CHECK (unit_price >= 0),
-                       stock_quantity REAL NOT NULL,
-                       min_quantity REAL NOT NULL CHECK (min_quantity >= 0),
-                       package_quantity REAL NOT NULL,
-                       unit_of_measure TEXT NOT NULL,
-                       FOREIGN KEY (type_id) REFERENCES MaterialTypes (id)
-                   )
-                   """)
+def import_data(incremental=False):
+    conn = connect('bulk')
 
-    cursor.execute("""
-                   CREATE TABLE IF NOT EXISTS ProductTypes
-                   (
-                       id INTEGER PRIMARY KEY AUTOINCREMENT,
-                       name TEXT NOT NULL,
-                       coefficient REAL NOT NULL
-                   )
-                   """)
-
-    cursor.execute("""
-                   CREATE TABLE IF NOT EXISTS Products
-                   (
-                       id INTEGER PRIMARY KEY AUTOINCREMENT,
-                       name TEXT NOT NULL,
-                       article TEXT NOT NULL UNIQUE,
-                       min_partner_price REAL NOT NULL,
-                       type_id INTEGER,
-                       FOREIGN KEY (type_id) REFERENCES ProductTypes (id)
-                   )
-                   """)
-
-    cursor.execute("""
-                   CREATE TABLE IF NOT EXISTS ProductMaterials
-                   (
-                       product_id INTEGER,
-                       material_id INTEGER,
-                       required_quantity REAL NOT NULL,
-                       PRIMARY KEY (product_id, material_id),
-                       FOREIGN KEY (product_id) REFERENCES Products (id),
-                       FOREIGN KEY (material_id) REFERENCES Materials (id)
-                   )
-                   """)
+    # Create or upgrade the schema
+    migrate(conn)
+    cursor = conn.cursor()
 
-    # Clear tables in correct order
-    cursor.execute("DELETE FROM ProductMaterials")
-    cursor.execute("DELETE FROM Products")
-    cursor.execute("DELETE FROM Materials")
-    cursor.execute("DELETE FROM ProductTypes")
-    cursor.execute("DELETE FROM MaterialTypes")
-    conn.commit()
+    if incremental:
+        # Apply only changed rows, keeping existing ids
+        importer.sync_all(conn)
+    else:
+        # Clear tables in correct order
+        cursor.execute("DELETE FROM ImportHashes")
+        cursor.execute("DELETE FROM ProductMaterials")
+        cursor.execute("DELETE FROM Products")
+        cursor.execute("DELETE FROM Materials")
+        cursor.execute("DELETE FROM ProductTypes")
+        cursor.execute("DELETE FROM MaterialTypes")
+        conn.commit()
 
 
 
@@ -0,0 +1,588 @@
+import csv
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# Размер пачки строк для executemany
+BATCH_SIZE = 5000
+
+# Сколько последних записей журнала изменений (ChangeLog) оставлять после импорта:
+# GUI, отставший больше чем на журнал, перечитывает список целиком
+CHANGE_LOG_KEEP = 10000
+
+# Файлы импорта в порядке зависимостей по внешним ключам:
+# (таблица, файл, количество столбцов)
+IMPORT_FILES = [
+    ('MaterialTypes', 'Material_type_import.xlsx', 2),
+    ('Materials', 'Materials_import.xlsx', 7),
+    ('ProductTypes', 'Product_type_import.xlsx', 2),
+    ('Products', 'Products_import.xlsx', 4),
+    ('ProductMaterials', 'Material_products__import.xlsx', 3),
+]
+
+# Числовые столбцы файлов импорта. В CSV и TSV все значения - строки, они
+# приводятся к тем же типам, что openpyxl дает для ячеек XLSX, поэтому строки
+# из любого источника одинаковы (и одинаковы их хеши при инкрементальном импорте).
+# Артикул продукции - текст, даже из одних цифр: 0012345 не должен стать 12345
+NUMERIC_COLUMNS = {
+    'MaterialTypes': (1,),
+    'Materials': (2, 3, 4, 5),
+    'ProductTypes': (1,),
+    'Products': (3,),
+    'ProductMaterials': (2,),
+}
+
+# Повтор артикула или пары (продукция, материал) в файле ожидаем: такие строки
+# пропускает сама вставка (INSERT OR IGNORE), см. insert_batch
+INSERT_QUERIES = {
+    'MaterialTypes': 'INSERT INTO MaterialTypes (name, loss_percentage) VALUES (?, ?)',
+    'Materials': '''
+                 INSERT INTO Materials (name, type_id, unit_price, stock_quantity,
+                                        min_quantity, package_quantity, unit_of_measure)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)
+                 ''',
+    'ProductTypes': 'INSERT INTO ProductTypes (name, coefficient) VALUES (?, ?)',
+    'Products': '''
+                INSERT OR IGNORE INTO Products (name, article, min_partner_price, type_id)
+                VALUES (?, ?, ?, ?)
+                ''',
+    'ProductMaterials': '''
+                        INSERT OR IGNORE INTO ProductMaterials (product_id, material_id, required_quantity)
+                        VALUES (?, ?, ?)
+                        ''',
+}
+
+UPDATE_QUERIES = {
+    'MaterialTypes': 'UPDATE MaterialTypes SET name = ?, loss_percentage = ? WHERE id = ?',
+    'Materials': '''
+                 UPDATE Materials
+                 SET name             = ?,
+                     type_id          = ?,
+                     unit_price       = ?,
+                     stock_quantity   = ?,
+                     min_quantity     = ?,
+                     package_quantity = ?,
+                     unit_of_measure  = ?
+                 WHERE id = ?
+                 ''',
+    'ProductTypes': 'UPDATE ProductTypes SET name = ?, coefficient = ? WHERE id = ?',
+    'Products': '''
+                UPDATE Products
+                SET name              = ?,
+                    article           = ?,
+                    min_partner_price = ?,
+                    type_id           = ?
+                WHERE id = ?
+                ''',
+    'ProductMaterials': '''
+                        UPDATE ProductMaterials
+                        SET product_id        = ?,
+                            material_id       = ?,
+                            required_quantity = ?
+                        WHERE rowid = ?
+                        ''',
+}
+
+# Удаление строки по id вместе с зависимыми связями
+DELETE_QUERIES = {
+    'MaterialTypes': ['DELETE FROM MaterialTypes WHERE id = ?'],
+    'Materials': ['DELETE FROM ProductMaterials WHERE material_id = ?',
+                  'DELETE FROM Materials WHERE id = ?'],
+    'ProductTypes': ['DELETE FROM ProductTypes WHERE id = ?'],
+    'Products': ['DELETE FROM ProductMaterials WHERE product_id = ?',
+                 'DELETE FROM Products WHERE id = ?'],
+    'ProductMaterials': ['DELETE FROM ProductMaterials WHERE rowid = ?'],
+}
+
+# Связи, удаляемые вместе с материалом или продукцией: их ключи в ImportHashes
+CASCADE_KEY_QUERIES = {
+    'Materials': "SELECT product_id || ':' || material_id FROM ProductMaterials WHERE material_id = ?",
+    'Products': "SELECT product_id || ':' || material_id FROM ProductMaterials WHERE product_id = ?",
+}
+
+# Естественный ключ строки -> id (для связей - rowid)
+KEY_QUERIES = {
+    'MaterialTypes': 'SELECT name, id FROM MaterialTypes ORDER BY id DESC',
+    'Materials': 'SELECT name, id FROM Materials ORDER BY id DESC',
+    'ProductTypes': 'SELECT name, id FROM ProductTypes ORDER BY id DESC',
+    'Products': 'SELECT CAST(article AS TEXT), id FROM Products',
+    'ProductMaterials': "SELECT product_id || ':' || material_id, rowid FROM ProductMaterials",
+}
+
+ERROR_MESSAGES = {
+    'MaterialTypes': 'Ошибка при импорте типов материалов',
+    'Materials': 'Ошибка при импорте материалов',
+    'ProductTypes': 'Ошибка при импорте типов продукции',
+    'Products': 'Ошибка при импорте продукции',
+    'ProductMaterials': 'Ошибка при импорте связей материалов и продукции',
+}
+
+
+def read_xlsx_rows(path, table, columns):
+    """Потоковое чтение строк листа без загрузки книги целиком"""
+    # openpyxl нужен только для чтения книг: модули, использующие importer
+    # для справочников и пачек (GUI, пакетный расчет), его не загружают
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in wb.active.iter_rows(min_row=2, values_only=True):
+            row = tuple(row[:columns])
+            # В режиме read_only лист может содержать хвост из пустых строк
+            if any(value is not None for value in row):
+                yield row
+    finally:
+        wb.close()
+
+
+def parse_number(value):
+    """Число из текста ячейки, как в openpyxl: int без дробной части и порядка, иначе float"""
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        if '.' in value or ',' in value or 'e' in value or 'E' in value:
+            # Десятичная запятая - в CSV из Excel с русской локалью
+            return float(value.replace(',', '.'))
+        return int(value)
+    except ValueError:
+        # Нечисловое значение передается как есть, как текстовая ячейка XLSX
+        return value
+
+
+def parse_text(value):
+    return value if value else None
+
+
+def read_delimited_rows(path, table, columns, delimiter=None):
+    """Потоковое чтение CSV/TSV модулем csv; первая строка - заголовок.
+
+    Без delimiter разделитель (',' или ';') определяется по заголовку.
+    """
+    numeric = NUMERIC_COLUMNS.get(table, ())
+    converters = [parse_number if i in numeric else parse_text for i in range(columns)]
+    padding = [''] * columns
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        header = f.readline()
+        if delimiter is None:
+            delimiter = ';' if header.count(';') > header.count(',') else ','
+        for row in csv.reader(f, delimiter=delimiter):
+            if len(row) < columns:
+                row += padding[len(row):]
+            row = tuple([convert(value) for convert, value in zip(converters, row)])
+            if any(value is not None for value in row):
+                yield row
+
+
+def read_csv_rows(path, table, columns):
+    return read_delimited_rows(path, table, columns)
+
+
+def read_tsv_rows(path, table, columns):
+    return read_delimited_rows(path, table, columns, '\t')
+
+
+# Источники строк по расширению файла: каждый читатель возвращает кортежи
+# из columns значений; новый формат подключается добавлением читателя сюда
+SOURCE_READERS = {
+    '.xlsx': read_xlsx_rows,
+    '.csv': read_csv_rows,
+    '.tsv': read_tsv_rows,
+}
+
+
+def source_reader(path):
+    extension = os.path.splitext(path)[1].lower()
+    reader = SOURCE_READERS.get(extension)
+    if reader is None:
+        raise ValueError(f"Неподдерживаемый формат файла импорта: {path}")
+    return reader
+
+
+def read_source(path, table, columns):
+    return source_reader(path)(path, table, columns)
+
+
+def source_files(directory='', extension='.xlsx'):
+    """IMPORT_FILES с файлами в directory и с заданным расширением (форматом)"""
+    return [(table, os.path.join(directory, os.path.splitext(file_name)[0] + extension), columns)
+            for table, file_name, columns in IMPORT_FILES]
+
+
+def parse_file(path, table, columns):
+    """Разбор файла целиком; выполняется в дочернем процессе"""
+    return list(read_source(path, table, columns))
+
+
+def future_rows(future):
+    # Ошибка разбора поднимается при чтении строк, внутри обработчика таблицы
+    yield from future.result()
+
+
+def iter_sources(files, parallel=False):
+    """Пары (таблица, строки) в порядке зависимостей по внешним ключам.
+
+    При parallel=True все файлы разбираются одновременно в пуле процессов,
+    а запись идет в одном потоке по мере готовности нужной таблицы.
+    """
+    if not parallel:
+        for table, path, columns in files:
+            yield table, read_source(path, table, columns)
+        return
+
+    workers = min(len(files), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Разобранные строки хранит Future: после записи таблицы ссылка на него
+        # снимается, чтобы в памяти не копились строки всех файлов
+        pending = deque((table, pool.submit(parse_file, path, table, columns)) for table, path, columns in files)
+        while pending:
+            table, future = pending.popleft()
+            yield table, future_rows(future)
+
+
+def load_name_map(cursor, table):
+    """Словарь имя -> id; при повторах имени побеждает меньший id, как в SELECT ... fetchone()"""
+    cursor.execute(f'SELECT name, id FROM {table} ORDER BY id DESC')
+    return dict(cursor.fetchall())
+
+
+def convert_row(table, row, maps):
+    """Преобразование строки файла в параметры INSERT; None, если ссылка не найдена"""
+    if table == 'Materials':
+        material_name, type_name, *rest = row
+        type_id = maps['MaterialTypes'].get(type_name)
+        if type_id is None:
+            print(f"Тип материала '{type_name}' не найден для материала '{material_name}'")
+            return None
+        return (material_name, type_id, *rest)
+
+    if table == 'Products':
+        type_name, product_name, article, price = row
+        type_id = maps['ProductTypes'].get(type_name)
+        if type_id is None:
+            print(f"Тип продукции '{type_name}' не найден для продукта '{product_name}'")
+            return None
+        # Числовая ячейка XLSX с артикулом - тоже текст, как в CSV и в столбце article
+        if article is not None and not isinstance(article, str):
+            article = str(article)
+        return (product_name, article, price, type_id)
+
+    if table == 'ProductMaterials':
+        material_name, product_name, quantity = row
+        material_id = maps['Materials'].get(material_name)
+        product_id = maps['Products'].get(product_name)
+        if material_id is None or product_id is None:
+            if material_id is None:
+                print(f"Материал '{material_name}' не найден")
+            if product_id is None:
+                print(f"Продукт '{product_name}' не найден")
+            return None
+        return (product_id, material_id, quantity)
+
+    return row
+
+
+def batched(rows, size):
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def peak_memory_mb():
+    """Пиковый объем памяти процесса в МБ (None, если платформа не поддерживает)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS - байты
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def insert_batch(cursor, table, params):
+    """Вставка пачки, возвращает число вставленных строк.
+
+    Без точки сохранения: внутри большой транзакции импорта каждая точка
+    сохранения копирует затронутые страницы в поджурнал, и с ростом таблицы
+    импорт замедляется квадратично. Строки с повторным ключом пропускает
+    INSERT OR IGNORE; строка, нарушившая другое ограничение (CHECK, NOT NULL),
+    пропускается, а вставка продолжается со следующей - строки перед ней
+    уже вставлены.
+    """
+    inserted = 0
+    start = 0
+    while start < len(params):
+        current = [start]
+
+        def rows():
+            for i in range(start, len(params)):
+                current[0] = i
+                yield params[i]
+
+        try:
+            cursor.executemany(INSERT_QUERIES[table], rows())
+        except sqlite3.IntegrityError as e:
+            failed = current[0]
+            print(f"Строка {params[failed]} пропущена: {e}")
+            inserted += failed - start
+            start = failed + 1
+            continue
+        # rowcount, а не total_changes: тот учитывает и строки, записанные триггерами
+        skipped = len(params) - start - cursor.rowcount
+        if skipped:
+            print(f"{table}: пропущено строк с повторным ключом: {skipped}")
+        inserted += cursor.rowcount
+        break
+    return inserted
+
+
+def write_table(cursor, table, rows, maps, progress_callback=None, batch_size=BATCH_SIZE,
+                hashes=None):
+    """Пакетная вставка строк одной таблицы, возвращает число вставленных строк.
+
+    В список hashes, если он передан, добавляются хеши вставленных строк
+    для ImportHashes (см. write_hashes).
+    """
+    inserted = 0
+    processed = 0
+    for batch in batched(rows, batch_size):
+        processed += len(batch)
+        params = [p for p in (convert_row(table, row, maps) for row in batch) if p is not None]
+        inserted += insert_batch(cursor, table, params)
+        if hashes is not None:
+            hashes.extend((table, natural_key(table, p), row_hash(p)) for p in params)
+        if progress_callback:
+            progress_callback(table, processed)
+    return inserted
+
+
+def write_hashes(cursor, hashes):
+    """Хеши строк полной загрузки, чтобы следующий инкрементальный импорт
+    изменял только действительно изменившиеся строки.
+
+    Пишутся одним проходом после всех таблиц: незафиксированные страницы
+    ImportHashes в той же транзакции замедляют вставку ProductMaterials в разы.
+    При повторе ключа действует первая строка, как в sync_table.
+    """
+    cursor.executemany('INSERT OR IGNORE INTO ImportHashes VALUES (?, ?, ?)', hashes)
+
+
+def pause_change_log(cursor):
+    """Отключить построчный журнал изменений и счетчик связей на время полной перезагрузки.
+
+    Триггеры удаляются в транзакции импорта и возвращаются
+    reset_change_log; возвращает их определения. Транзакция открывается
+    здесь явно: перед DDL модуль sqlite3 сам ее не начинает, и без BEGIN
+    каждый DROP TRIGGER фиксировался бы сразу - прерванный импорт оставил
+    бы базу без журнала изменений.
+    """
+    if not cursor.connection.in_transaction:
+        cursor.execute('BEGIN')
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+                   "AND (name GLOB 'trg_*_log_*' OR name GLOB 'trg_*_links_*')")
+    triggers = cursor.fetchall()
+    for name, _ in triggers:
+        cursor.execute(f'DROP TRIGGER {name}')
+    return triggers
+
+
+def reset_change_log(cursor, triggers):
+    """Вернуть триггеры журнала и записать 'R': список материалов и связи нужно перечитать целиком"""
+    for _, sql in triggers:
+        cursor.execute(sql)
+    cursor.execute("INSERT INTO ChangeLog (material_id, operation) VALUES (0, 'R')")
+    cursor.execute("UPDATE DataVersions SET version = version + 1 WHERE name = 'links'")
+
+
+def prune_change_log(cursor, keep=CHANGE_LOG_KEEP):
+    cursor.execute('DELETE FROM ChangeLog WHERE seq <= (SELECT MAX(seq) FROM ChangeLog) - ?', (keep,))
+
+
+def import_all(conn, progress_callback=None, batch_size=BATCH_SIZE, files=None, parallel=False):
+    """Полная перезагрузка данных из файлов импорта одной транзакцией"""
+    files = files or IMPORT_FILES
+    started = time.perf_counter()
+    cursor = conn.cursor()
+
+    log_triggers = pause_change_log(cursor)
+
+    # Очистка таблиц в правильном порядке
+    cursor.execute("DELETE FROM ImportHashes")
+    cursor.execute("DELETE FROM ProductMaterials")
+    cursor.execute("DELETE FROM Products")
+    cursor.execute("DELETE FROM Materials")
+    cursor.execute("DELETE FROM ProductTypes")
+    cursor.execute("DELETE FROM MaterialTypes")
+
+    maps = {}
+    counts = {}
+    hashes = []
+    for table, rows in iter_sources(files, parallel):
+        try:
+            counts[table] = write_table(cursor, table, rows, maps, progress_callback, batch_size,
+                                        hashes)
+        except Exception as e:
+            counts[table] = 0
+            print(f"{ERROR_MESSAGES[table]}: {e}")
+        if table != 'ProductMaterials':
+            maps[table] = load_name_map(cursor, table)
+    write_hashes(cursor, hashes)
+
+    reset_change_log(cursor, log_triggers)
+    prune_change_log(cursor)
+    conn.commit()
+
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    stats = {
+        'rows': total,
+        'tables': counts,
+        'seconds': elapsed,
+        'rows_per_sec': total / elapsed if elapsed > 0 else 0.0,
+        'peak_memory_mb': peak_memory_mb(),
+    }
+    print_stats(stats)
+    return stats
+
+
+def natural_key(table, params):
+    """Естественный ключ строки: наименование, артикул или пара (продукт, материал)"""
+    if table == 'Products':
+        return str(params[1])
+    if table == 'ProductMaterials':
+        return f"{params[0]}:{params[1]}"
+    return params[0]
+
+
+def row_hash(params):
+    # Числа приводятся к float: 1500 из CSV и 1500.0 из Excel - одно значение
+    values = tuple(float(v) if isinstance(v, (int, float)) else v for v in params)
+    return hashlib.blake2b(repr(values).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def sync_table(cursor, table, rows, maps, progress_callback=None, batch_size=BATCH_SIZE):
+    """Вставка и обновление только изменившихся строк таблицы.
+
+    Возвращает счетчики и множество ключей, встреченных в файле,
+    по которому затем удаляются пропавшие строки.
+    """
+    cursor.execute(KEY_QUERIES[table])
+    ids = dict(cursor.fetchall())
+    cursor.execute('SELECT natural_key, row_hash FROM ImportHashes WHERE table_name = ?', (table,))
+    hashes = dict(cursor.fetchall())
+
+    counts = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+    seen = set()
+    processed = 0
+    for batch in batched(rows, batch_size):
+        processed += len(batch)
+        inserts, updates, new_hashes = [], [], []
+        for row in batch:
+            params = convert_row(table, row, maps)
+            if params is None:
+                continue
+            key = natural_key(table, params)
+            if key in seen:
+                print(f"Повторный ключ '{key}' в таблице {table} пропущен")
+                continue
+            seen.add(key)
+
+            digest = row_hash(params)
+            if key in ids:
+                if hashes.get(key) == digest:
+                    counts['unchanged'] += 1
+                    continue
+                updates.append((*params, ids[key]))
+            else:
+                inserts.append(params)
+            new_hashes.append((table, key, digest))
+
+        if inserts:
+            counts['inserted'] += insert_batch(cursor, table, inserts)
+        if updates:
+            cursor.executemany(UPDATE_QUERIES[table], updates)
+            counts['updated'] += len(updates)
+        cursor.executemany('INSERT OR REPLACE INTO ImportHashes VALUES (?, ?, ?)', new_hashes)
+        if progress_callback:
+            progress_callback(table, processed)
+
+    return counts, ids, seen
+
+
+def delete_missing(cursor, table, ids, seen):
+    """Удаление строк, которых больше нет в файле импорта.
+
+    Возвращает (удалено строк таблицы, удалено вместе с ними связей ProductMaterials).
+    """
+    missing = [(key, row_id) for key, row_id in ids.items() if key not in seen]
+    hash_keys = [(table, key) for key, _ in missing]
+    cascaded = 0
+    if table in CASCADE_KEY_QUERIES:
+        for _, row_id in missing:
+            cursor.execute(CASCADE_KEY_QUERIES[table], (row_id,))
+            links = [('ProductMaterials', key) for key, in cursor.fetchall()]
+            hash_keys.extend(links)
+            cascaded += len(links)
+    for query in DELETE_QUERIES[table]:
+        cursor.executemany(query, [(row_id,) for _, row_id in missing])
+    cursor.executemany('DELETE FROM ImportHashes WHERE table_name = ? AND natural_key = ?', hash_keys)
+    return len(missing), cascaded
+
+
+def sync_all(conn, progress_callback=None, batch_size=BATCH_SIZE, files=None, parallel=False):
+    """Инкрементальный импорт: изменяются только добавленные, измененные и удаленные строки"""
+    files = files or IMPORT_FILES
+    started = time.perf_counter()
+    cursor = conn.cursor()
+
+    maps = {}
+    counts = {}
+    pending_deletes = []
+    for table, rows in iter_sources(files, parallel):
+        try:
+            counts[table], ids, seen = sync_table(cursor, table, rows, maps, progress_callback, batch_size)
+            pending_deletes.append((table, ids, seen))
+        except Exception as e:
+            counts[table] = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+            print(f"{ERROR_MESSAGES[table]}: {e}")
+        if table != 'ProductMaterials':
+            maps[table] = load_name_map(cursor, table)
+
+    # Удаление в обратном порядке зависимостей: сначала связи, затем справочники
+    for table, ids, seen in reversed(pending_deletes):
+        counts[table]['deleted'], cascaded = delete_missing(cursor, table, ids, seen)
+        if cascaded:
+            counts['ProductMaterials']['deleted'] += cascaded
+
+    prune_change_log(cursor)
+    conn.commit()
+
+    elapsed = time.perf_counter() - started
+    touched = sum(c['inserted'] + c['updated'] + c['deleted'] for c in counts.values())
+    stats = {
+        'rows': touched,
+        'tables': counts,
+        'seconds': elapsed,
+        'rows_per_sec': touched / elapsed if elapsed > 0 else 0.0,
+        'peak_memory_mb': peak_memory_mb(),
+    }
+    for table, c in counts.items():
+        print(f"{table}: добавлено {c['inserted']}, изменено {c['updated']}, "
+              f"удалено {c['deleted']}, без изменений {c['unchanged']}")
+    print_stats(stats)
+    return stats
+
+
+def print_stats(stats):
+    memory = stats['peak_memory_mb']
+    memory_text = f"{memory:.1f} МБ" if memory is not None else "н/д"
+    print(f"Импортировано строк: {stats['rows']} за {stats['seconds']:.2f} с "
+          f"({stats['rows_per_sec']:.0f} строк/с), пик памяти: {memory_text}")
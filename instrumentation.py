@@ -0,0 +1,187 @@
+"""Трассировка запросов SQLite: время, число строк и вызовов по каждому запросу.
+
+Включается переменной окружения OBRAZ_PLUS_TRACE=1 или вызовом enable()
+до открытия соединений. В выключенном состоянии соединения создаются
+обычным sqlite3.Connection, и накладных расходов нет.
+
+Здесь же замер запуска GUI (main.py --startup-report или OBRAZ_PLUS_STARTUP=1):
+время до импорта модулей, создания окна, первой отрисовки и первых данных.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+# Верхние границы интервалов гистограммы задержек, мс
+BUCKETS_MS = [0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, float('inf')]
+
+enabled = False
+slow_query_ms = float(os.environ.get('OBRAZ_PLUS_SLOW_MS', 100))
+dump_path = os.environ.get('OBRAZ_PLUS_TRACE_FILE', 'query_stats.json')
+
+_lock = threading.Lock()
+_stats = {}
+_slow_log = deque(maxlen=1000)
+_totals = {'queries': 0, 'ms': 0.0, 'slow': 0}
+
+
+def enable(slow_ms=None, path=None):
+    """Включить трассировку; статистика сохраняется в файл при выходе"""
+    global enabled, slow_query_ms, dump_path
+    if slow_ms is not None:
+        slow_query_ms = slow_ms
+    if path is not None:
+        dump_path = path
+    if not enabled:
+        enabled = True
+        atexit.register(dump)
+
+
+def normalize(sql):
+    return ' '.join(sql.split())[:300]
+
+
+def record(sql, elapsed_ms, rows=0):
+    key = normalize(sql)
+    with _lock:
+        stat = _stats.get(key)
+        if stat is None:
+            stat = _stats[key] = {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                                  'histogram': [0] * len(BUCKETS_MS)}
+        stat['calls'] += 1
+        stat['total_ms'] += elapsed_ms
+        stat['max_ms'] = max(stat['max_ms'], elapsed_ms)
+        stat['rows'] += rows
+        stat['histogram'][next(i for i, bound in enumerate(BUCKETS_MS) if elapsed_ms <= bound)] += 1
+        _totals['queries'] += 1
+        _totals['ms'] += elapsed_ms
+        if elapsed_ms >= slow_query_ms:
+            _totals['slow'] += 1
+            _slow_log.append({'time': time.time(), 'ms': round(elapsed_ms, 3), 'sql': key})
+
+
+def add_rows(sql, rows, elapsed_ms):
+    """Строки и время выборки, полученные после execute"""
+    key = normalize(sql)
+    with _lock:
+        stat = _stats.get(key)
+        if stat is not None:
+            stat['rows'] += rows
+            stat['total_ms'] += elapsed_ms
+            _totals['ms'] += elapsed_ms
+
+
+class TracingCursor(sqlite3.Cursor):
+    """Курсор, замеряющий выполнение запросов и выборку строк"""
+    last_sql = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.last_sql = sql
+            record(sql, (time.perf_counter() - started) * 1000, max(self.rowcount, 0))
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.last_sql = sql
+            record(sql, (time.perf_counter() - started) * 1000, max(self.rowcount, 0))
+
+    def fetched(self, rows, started):
+        if self.last_sql is not None:
+            add_rows(self.last_sql, rows, (time.perf_counter() - started) * 1000)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self.fetched(0 if row is None else 1, started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.fetched(len(rows), started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self.fetched(len(rows), started)
+        return rows
+
+
+class TracingConnection(sqlite3.Connection):
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    # Connection.execute создает курсор в обход cursor(), поэтому переопределяется отдельно
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def summary():
+    """Счетчики для строки состояния: (запросов, суммарное время мс, медленных)"""
+    with _lock:
+        return _totals['queries'], _totals['ms'], _totals['slow']
+
+
+def snapshot():
+    with _lock:
+        queries = {sql: dict(stat, histogram=list(stat['histogram'])) for sql, stat in _stats.items()}
+        return {
+            'totals': dict(_totals),
+            'slow_query_ms': slow_query_ms,
+            'buckets_ms': [str(bound) for bound in BUCKETS_MS],
+            'queries': dict(sorted(queries.items(), key=lambda item: -item[1]['total_ms'])),
+            'slow_log': list(_slow_log),
+        }
+
+
+def dump(path=None):
+    """Сохранить статистику запросов в JSON"""
+    with open(path or dump_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f, ensure_ascii=False, indent=2)
+
+
+# Этапы запуска GUI: (ключ, подпись) в порядке отчета
+STARTUP_STAGES = [('imports', 'импорт модулей'), ('window', 'главное окно'),
+                  ('first_paint', 'первая отрисовка'), ('first_data', 'первые данные')]
+
+_startup_origin = None
+_startup_marks = {}
+
+
+def startup_begin(origin=None):
+    """Включить замер запуска; origin - time.perf_counter() в начале программы"""
+    global _startup_origin
+    _startup_origin = time.perf_counter() if origin is None else origin
+
+
+def startup_mark(stage):
+    """Отметить первое достижение этапа; отчет печатается, когда отмечены все этапы"""
+    if _startup_origin is None or stage in _startup_marks:
+        return
+    _startup_marks[stage] = time.perf_counter() - _startup_origin
+    if len(_startup_marks) == len(STARTUP_STAGES):
+        print(startup_report(), file=sys.stderr, flush=True)
+
+
+def startup_report():
+    parts = [f"{title} {_startup_marks[stage] * 1000:.0f} мс"
+             for stage, title in STARTUP_STAGES if stage in _startup_marks]
+    return "Запуск: " + ", ".join(parts)
+
+
+if os.environ.get('OBRAZ_PLUS_TRACE') == '1':
+    enable()
@@ -1,12 +1,25 @@
-from PyQt6.QtGui import QIcon
+import os
+import sys
+import time
+
+# Отсчет для отчета о запуске (--startup-report) - до импорта PyQt6 и модулей приложения
+STARTED = time.perf_counter()
 
-from gui import MainWindow
+from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import QApplication
-import sys
+
+import instrumentation
+from gui import LOGO_PATH, MainWindow
 
 if __name__ == "__main__":
+    if '--trace' in sys.argv:
+        instrumentation.enable()
+    if '--startup-report' in sys.argv or os.environ.get('OBRAZ_PLUS_STARTUP') == '1':
+        instrumentation.startup_begin(STARTED)
+    instrumentation.startup_mark('imports')
     app = QApplication(sys.argv)
-    app.setWindowIcon(QIcon('Образ плюс.png'))
+    app.setWindowIcon(QIcon(LOGO_PATH))
     window = MainWindow()
+    instrumentation.startup_mark('window')
     window.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    sys.exit(app.exec())
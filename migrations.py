@@ -0,0 +1,436 @@
+import sys
+
+from connection import connect
+
+# Журнал изменений материалов для точечного обновления списка в GUI:
+# изменение состава меняет столбец "Требуется", поэтому тоже попадает в журнал
+CHANGE_LOG_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS ChangeLog
+        (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            material_id INTEGER NOT NULL,
+            -- 'R' - перечитать все: полная перезагрузка идет без построчного журнала
+            operation TEXT NOT NULL CHECK (operation IN ('I', 'U', 'D', 'R'))
+        );
+
+        CREATE TRIGGER IF NOT EXISTS trg_materials_log_insert
+            AFTER INSERT ON Materials
+        BEGIN
+            INSERT INTO ChangeLog (material_id, operation) VALUES (NEW.id, 'I');
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_materials_log_update
+            AFTER UPDATE ON Materials
+        BEGIN
+            INSERT INTO ChangeLog (material_id, operation) VALUES (NEW.id, 'U');
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_materials_log_delete
+            AFTER DELETE ON Materials
+        BEGIN
+            INSERT INTO ChangeLog (material_id, operation) VALUES (OLD.id, 'D');
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_productmaterials_log_insert
+            AFTER INSERT ON ProductMaterials
+        BEGIN
+            INSERT INTO ChangeLog (material_id, operation) VALUES (NEW.material_id, 'U');
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_productmaterials_log_update
+            AFTER UPDATE OF material_id, required_quantity ON ProductMaterials
+        BEGIN
+            INSERT INTO ChangeLog (material_id, operation) VALUES (OLD.material_id, 'U');
+            INSERT INTO ChangeLog (material_id, operation)
+            SELECT NEW.material_id, 'U' WHERE NEW.material_id IS NOT OLD.material_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_productmaterials_log_delete
+            AFTER DELETE ON ProductMaterials
+        BEGIN
+            INSERT INTO ChangeLog (material_id, operation) VALUES (OLD.material_id, 'U');
+        END;
+"""
+
+# Счетчик изменений связей продукции и материалов: индекс связей в памяти
+# (adjacency.py) перестраивается только при их изменении, а не после
+# любой правки остатков
+LINKS_VERSION_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS DataVersions
+        (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO DataVersions (name, version) VALUES ('links', 0);
+
+        CREATE TRIGGER IF NOT EXISTS trg_products_links_insert
+            AFTER INSERT ON Products
+        BEGIN
+            UPDATE DataVersions SET version = version + 1 WHERE name = 'links';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_products_links_update
+            AFTER UPDATE OF name, type_id ON Products
+        BEGIN
+            UPDATE DataVersions SET version = version + 1 WHERE name = 'links';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_products_links_delete
+            AFTER DELETE ON Products
+        BEGIN
+            UPDATE DataVersions SET version = version + 1 WHERE name = 'links';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_productmaterials_links_insert
+            AFTER INSERT ON ProductMaterials
+        BEGIN
+            UPDATE DataVersions SET version = version + 1 WHERE name = 'links';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_productmaterials_links_update
+            AFTER UPDATE OF product_id, material_id, required_quantity ON ProductMaterials
+        BEGIN
+            UPDATE DataVersions SET version = version + 1 WHERE name = 'links';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_productmaterials_links_delete
+            AFTER DELETE ON ProductMaterials
+        BEGIN
+            UPDATE DataVersions SET version = version + 1 WHERE name = 'links';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_producttypes_links_update
+            AFTER UPDATE OF coefficient ON ProductTypes
+        BEGIN
+            UPDATE DataVersions SET version = version + 1 WHERE name = 'links';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_producttypes_links_delete
+            AFTER DELETE ON ProductTypes
+        BEGIN
+            UPDATE DataVersions SET version = version + 1 WHERE name = 'links';
+        END;
+"""
+
+# Миграции схемы: (версия, SQL). Номер последней примененной миграции
+# хранится в PRAGMA user_version; новые миграции только добавляются в конец.
+MIGRATIONS = [
+    (1, """
+        CREATE TABLE IF NOT EXISTS MaterialTypes
+        (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            loss_percentage REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS Materials
+        (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            type_id INTEGER,
+            unit_price REAL NOT NULL CHECK (unit_price >= 0),
+            stock_quantity REAL NOT NULL,
+            min_quantity REAL NOT NULL CHECK (min_quantity >= 0),
+            package_quantity REAL NOT NULL,
+            unit_of_measure TEXT NOT NULL,
+            FOREIGN KEY (type_id) REFERENCES MaterialTypes (id)
+        );
+
+        CREATE TABLE IF NOT EXISTS ProductTypes
+        (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            coefficient REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS Products
+        (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            article TEXT NOT NULL UNIQUE,
+            min_partner_price REAL NOT NULL,
+            type_id INTEGER,
+            FOREIGN KEY (type_id) REFERENCES ProductTypes (id)
+        );
+
+        CREATE TABLE IF NOT EXISTS ProductMaterials
+        (
+            product_id INTEGER,
+            material_id INTEGER,
+            required_quantity REAL NOT NULL,
+            PRIMARY KEY (product_id, material_id),
+            FOREIGN KEY (product_id) REFERENCES Products (id),
+            FOREIGN KEY (material_id) REFERENCES Materials (id)
+        );
+        """),
+    # Хэши строк для инкрементального импорта
+    (2, """
+        CREATE TABLE IF NOT EXISTS ImportHashes
+        (
+            table_name TEXT NOT NULL,
+            natural_key TEXT NOT NULL,
+            row_hash TEXT NOT NULL,
+            PRIMARY KEY (table_name, natural_key)
+        );
+        """),
+    # Индексы для поиска связей по материалу и имен при импорте
+    (3, """
+        CREATE INDEX IF NOT EXISTS idx_productmaterials_material
+            ON ProductMaterials (material_id, product_id, required_quantity);
+        CREATE INDEX IF NOT EXISTS idx_materials_name ON Materials (name);
+        CREATE INDEX IF NOT EXISTS idx_products_name ON Products (name);
+        CREATE INDEX IF NOT EXISTS idx_materialtypes_name ON MaterialTypes (name);
+        CREATE INDEX IF NOT EXISTS idx_producttypes_name ON ProductTypes (name);
+        """),
+    # Сводка по материалу для столбца "Требуется", поддерживается триггерами
+    (4, """
+        CREATE TABLE IF NOT EXISTS MaterialSummary
+        (
+            material_id INTEGER PRIMARY KEY,
+            total_required REAL NOT NULL,
+            product_count INTEGER NOT NULL
+        );
+
+        DELETE FROM MaterialSummary;
+        INSERT INTO MaterialSummary (material_id, total_required, product_count)
+        SELECT material_id, SUM(required_quantity), COUNT(*)
+        FROM ProductMaterials
+        GROUP BY material_id;
+
+        CREATE TRIGGER IF NOT EXISTS trg_productmaterials_summary_insert
+            AFTER INSERT ON ProductMaterials
+        BEGIN
+            INSERT INTO MaterialSummary (material_id, total_required, product_count)
+            VALUES (NEW.material_id, NEW.required_quantity, 1)
+            ON CONFLICT (material_id) DO UPDATE
+                SET total_required = total_required + excluded.total_required,
+                    product_count  = product_count + 1;
+        END;
+
+        -- При удалении последней связи сумма обнуляется, чтобы не копить ошибку округления
+        CREATE TRIGGER IF NOT EXISTS trg_productmaterials_summary_delete
+            AFTER DELETE ON ProductMaterials
+        BEGIN
+            UPDATE MaterialSummary
+            SET total_required = CASE WHEN product_count = 1 THEN 0
+                                      ELSE total_required - OLD.required_quantity END,
+                product_count  = product_count - 1
+            WHERE material_id = OLD.material_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_productmaterials_summary_update
+            AFTER UPDATE OF material_id, required_quantity ON ProductMaterials
+        BEGIN
+            UPDATE MaterialSummary
+            SET total_required = CASE WHEN product_count = 1 THEN 0
+                                      ELSE total_required - OLD.required_quantity END,
+                product_count  = product_count - 1
+            WHERE material_id = OLD.material_id;
+            INSERT INTO MaterialSummary (material_id, total_required, product_count)
+            VALUES (NEW.material_id, NEW.required_quantity, 1)
+            ON CONFLICT (material_id) DO UPDATE
+                SET total_required = total_required + excluded.total_required,
+                    product_count  = product_count + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_materials_summary_delete
+            AFTER DELETE ON Materials
+        BEGIN
+            DELETE FROM MaterialSummary WHERE material_id = OLD.id;
+        END;
+        """),
+    # Полнотекстовый поиск по материалам и индекс для фильтра по типу
+    (5, """
+        CREATE VIRTUAL TABLE IF NOT EXISTS MaterialsSearch USING fts5
+        (
+            name,
+            unit_of_measure,
+            content = 'Materials',
+            content_rowid = 'id',
+            tokenize = 'unicode61'
+        );
+        INSERT INTO MaterialsSearch (MaterialsSearch) VALUES ('rebuild');
+
+        CREATE TRIGGER IF NOT EXISTS trg_materials_search_insert
+            AFTER INSERT ON Materials
+        BEGIN
+            INSERT INTO MaterialsSearch (rowid, name, unit_of_measure)
+            VALUES (NEW.id, NEW.name, NEW.unit_of_measure);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_materials_search_delete
+            AFTER DELETE ON Materials
+        BEGIN
+            INSERT INTO MaterialsSearch (MaterialsSearch, rowid, name, unit_of_measure)
+            VALUES ('delete', OLD.id, OLD.name, OLD.unit_of_measure);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_materials_search_update
+            AFTER UPDATE OF name, unit_of_measure ON Materials
+        BEGIN
+            INSERT INTO MaterialsSearch (MaterialsSearch, rowid, name, unit_of_measure)
+            VALUES ('delete', OLD.id, OLD.name, OLD.unit_of_measure);
+            INSERT INTO MaterialsSearch (rowid, name, unit_of_measure)
+            VALUES (NEW.id, NEW.name, NEW.unit_of_measure);
+        END;
+
+        CREATE INDEX IF NOT EXISTS idx_materials_type ON Materials (type_id, id);
+        """),
+    # Сортировка списка материалов по столбцам: у каждого материала есть строка
+    # сводки, чтобы сортировка по "Требуется" шла по индексу сводки
+    (6, """
+        INSERT INTO MaterialSummary (material_id, total_required, product_count)
+        SELECT m.id, 0, 0
+        FROM Materials m
+        WHERE NOT EXISTS (SELECT 1 FROM MaterialSummary s WHERE s.material_id = m.id);
+
+        CREATE TRIGGER IF NOT EXISTS trg_materials_summary_insert
+            AFTER INSERT ON Materials
+        BEGIN
+            INSERT OR IGNORE INTO MaterialSummary (material_id, total_required, product_count)
+            VALUES (NEW.id, 0, 0);
+        END;
+
+        CREATE INDEX IF NOT EXISTS idx_materials_stock ON Materials (stock_quantity);
+        CREATE INDEX IF NOT EXISTS idx_materials_min ON Materials (min_quantity);
+        CREATE INDEX IF NOT EXISTS idx_materialsummary_required ON MaterialSummary (total_required, material_id);
+        """),
+    (7, CHANGE_LOG_SCHEMA),
+    (8, LINKS_VERSION_SCHEMA),
+    # Наименование типа материала тоже показывается в списке (и в снимке):
+    # его изменение или удаление типа требует перечитать список целиком.
+    # Повтор схем 7 и 8 возвращает триггеры, которые прерванный импорт
+    # удалял до исправления importer.pause_change_log
+    (9, CHANGE_LOG_SCHEMA + LINKS_VERSION_SCHEMA + """
+        CREATE TRIGGER IF NOT EXISTS trg_materialtypes_log_update
+            AFTER UPDATE OF name ON MaterialTypes
+        BEGIN
+            INSERT INTO ChangeLog (material_id, operation) VALUES (0, 'R');
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_materialtypes_log_delete
+            AFTER DELETE ON MaterialTypes
+        BEGIN
+            INSERT INTO ChangeLog (material_id, operation) VALUES (0, 'R');
+        END;
+        """),
+    # Индекс производственных возможностей (capacity.py) догоняет правки
+    # материалов по журналу, а полностью перестраивается по счетчику 'links':
+    # артикул продукции и процент потерь типа материала тоже входят в расчет
+    (10, """
+        CREATE TRIGGER IF NOT EXISTS trg_products_links_article
+            AFTER UPDATE OF article ON Products
+        BEGIN
+            UPDATE DataVersions SET version = version + 1 WHERE name = 'links';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_materialtypes_links_loss
+            AFTER UPDATE OF loss_percentage ON MaterialTypes
+        BEGIN
+            UPDATE DataVersions SET version = version + 1 WHERE name = 'links';
+        END;
+        """),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Применить недостающие миграции; каждая выполняется в своей транзакции"""
+    version = get_version(conn)
+    for target, script in MIGRATIONS:
+        if target <= version:
+            continue
+        conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {target};\nCOMMIT;")
+        version = target
+    return version
+
+
+# Проверка планов запросов DatabaseManager: (метод, аргументы, таблицы,
+# которые метод читает целиком намеренно - например, весь список материалов)
+PLAN_CHECKS = [
+    ('get_materials', (), {'m'}),
+    ('get_materials_page', (0, 500), set()),
+    ('get_materials_page', (0, 500, 'дуб', None), set()),
+    ('get_materials_page', (0, 500, None, 1), set()),
+    # Первая страница сортировки - проход по индексу столбца до LIMIT
+    ('get_materials_page', (0, 500, None, None, 0), {'m'}),
+    ('get_materials_page', (1, 500, None, None, 0, True, 'Материал'), set()),
+    ('get_materials_page', (1, 500, None, None, 1, False, 1), {'MaterialTypes'}),
+    ('get_materials_page', (1, 500, None, None, 2, False, 100.0), set()),
+    ('get_materials_page', (1, 500, None, None, 3, True, 100.0), set()),
+    ('get_materials_page', (1, 500, None, None, 4, True, 100.0), set()),
+    ('get_materials_page', (1, 500, 'дуб', None, 2, False, 100.0), set()),
+    # Справочники типов читаются целиком один раз и дальше берутся из памяти (calculator.py)
+    ('get_material_types', (), {'MaterialTypes', 'ProductTypes'}),
+    ('get_material_by_id', (1,), set()),
+    ('calculate_product_quantity', (1, 1, 100, 1, 1), {'MaterialTypes', 'ProductTypes'}),
+    ('calculate_product_quantities', ([1, 2], [1], 100, 1, 1), {'MaterialTypes', 'ProductTypes'}),
+    ('get_purchase_plan', (), {'m', 'MaterialTypes'}),
+    ('get_changes', (0,), set()),
+    ('get_materials_by_ids', ([1, 2, 3], 'дуб', 1), set()),
+]
+
+
+def full_scans(conn, sql):
+    """Таблицы, которые SQLite читает целиком при выполнении запроса.
+
+    Автоматический индекс тоже считается полным сканированием: SQLite
+    строит его заново при каждом выполнении запроса.
+    """
+    scans = []
+    for row in conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall():
+        detail = row[3]
+        if 'AUTOMATIC' in detail:
+            scans.append((detail.split()[1], detail))
+            continue
+        if not detail.startswith('SCAN '):
+            continue
+        table = detail.split()[1]
+        if table == 'CONSTANT' or table.startswith('('):
+            continue
+        # Поиск по полнотекстовому индексу идет через виртуальную таблицу; служебные
+        # запросы FTS5 к своим таблицам (main.*_config) выполняются один раз на соединение
+        if 'VIRTUAL TABLE INDEX' in detail or table.startswith('main.'):
+            continue
+        scans.append((table, detail))
+    return scans
+
+
+def check_query_plans(db):
+    """Выполнить запросы DatabaseManager и вернуть список неожиданных полных сканирований"""
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    problems = []
+    try:
+        for method, args, allowed in PLAN_CHECKS:
+            statements.clear()
+            getattr(db, method)(*args)
+            for sql in list(statements):
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                for table, detail in full_scans(db.conn, sql):
+                    if table not in allowed:
+                        problems.append(f"{method}: {detail}")
+    finally:
+        db.conn.set_trace_callback(None)
+    return problems
+
+
+if __name__ == "__main__":
+    conn = connect()
+    print(f"Версия схемы: {migrate(conn)}")
+    conn.close()
+
+    if '--check' in sys.argv:
+        from gui import DatabaseManager
+        problems = check_query_plans(DatabaseManager())
+        for problem in problems:
+            print(f"Полное сканирование: {problem}")
+        if problems:
+            sys.exit(1)
+        print("Планы запросов в порядке")
@@ -0,0 +1,119 @@
+import csv
+import sys
+
+import numpy as np
+
+# Допуск при делении на размер упаковки: 2.0000000001 упаковки - это 2, а не 3
+PACK_EPSILON = 1e-9
+# Знаков после запятой для количеств в отображении и экспорте
+QUANTITY_DIGITS = 6
+
+
+class PurchasePlan:
+    """План закупок: недостаток каждого материала до минимального количества
+    с учетом требуемого по составам продукции, округленный вверх до целых
+    упаковок, и его стоимость, с итогами по типам материалов.
+
+    Материалы с недостатком отбираются одним запросом, расчет упаковок,
+    стоимости и итогов по типам - одним проходом NumPy.
+    """
+    HEADERS = ["Материал", "Тип материала", "Недостаток", "Упаковок", "Закупить", "Стоимость"]
+    TYPE_HEADERS = ["Тип материала", "Материалов", "Стоимость"]
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.build()
+
+    def build(self):
+        query = """
+                SELECT m.id,
+                       m.name,
+                       COALESCE(m.type_id, 0)                                             AS type_id,
+                       m.min_quantity + COALESCE(s.total_required, 0) - m.stock_quantity AS shortfall,
+                       m.package_quantity,
+                       m.unit_price
+                FROM Materials m
+                         LEFT JOIN MaterialSummary s ON s.material_id = m.id
+                WHERE m.min_quantity + COALESCE(s.total_required, 0) > m.stock_quantity
+                ORDER BY m.id
+                """
+        cursor = self.conn.cursor()
+        cursor.execute(query)
+        rows = cursor.fetchall()
+        cursor.execute('SELECT id, name FROM MaterialTypes ORDER BY id')
+        types = cursor.fetchall()
+
+        columns = list(zip(*rows)) if rows else [(), (), (), (), (), ()]
+        self.material_ids = np.array(columns[0], dtype=np.int64)
+        self.names = list(columns[1])
+        # Материал без типа - id 0, такого типа нет
+        self.type_ids = np.array(columns[2], dtype=np.int64)
+        self.shortfall = np.array(columns[3], dtype=np.float64)
+        package = np.array(columns[4], dtype=np.float64)
+        price = np.array(columns[5], dtype=np.float64)
+
+        # Без размера упаковки закупается ровно недостаток
+        with np.errstate(divide='ignore', invalid='ignore'):
+            packs = np.ceil(self.shortfall / package - PACK_EPSILON)
+        has_package = package > 0
+        self.packs = np.where(has_package, packs, 0).astype(np.int64)
+        self.quantity = np.where(has_package, self.packs * package, self.shortfall)
+        self.cost = self.quantity * price
+
+        # Итоги по каждой строке MaterialTypes, включая типы без закупок
+        self.type_list = [type_id for type_id, _ in types]
+        self.type_names = dict(types)
+        positions = np.searchsorted(np.array(self.type_list, dtype=np.int64), self.type_ids)
+        known = np.isin(self.type_ids, self.type_list)
+        count = len(self.type_list)
+        self.type_counts = np.bincount(positions[known], minlength=count).astype(np.int64)
+        self.type_costs = np.bincount(positions[known], weights=self.cost[known], minlength=count)
+        self.total_cost = float(self.cost.sum())
+
+    def __len__(self):
+        return len(self.material_ids)
+
+    def type_name(self, type_id):
+        return self.type_names.get(type_id, "")
+
+    def row(self, i):
+        """Строка плана в порядке HEADERS"""
+        return (self.names[i], self.type_name(int(self.type_ids[i])),
+                round(float(self.shortfall[i]), QUANTITY_DIGITS), int(self.packs[i]),
+                round(float(self.quantity[i]), QUANTITY_DIGITS), round(float(self.cost[i]), 2))
+
+    def rows(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def type_rows(self):
+        """Итоги по типам в порядке TYPE_HEADERS"""
+        for i, type_id in enumerate(self.type_list):
+            yield self.type_names[type_id], int(self.type_counts[i]), round(float(self.type_costs[i]), 2)
+
+    def write_csv(self, path, delimiter=';'):
+        """Экспорт плана: строки материалов, затем итоги по типам и общий итог"""
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f, delimiter=delimiter)
+            writer.writerow(self.HEADERS)
+            writer.writerows(self.rows())
+            writer.writerow([])
+            writer.writerow(self.TYPE_HEADERS)
+            writer.writerows(self.type_rows())
+            writer.writerow(["Итого", len(self), round(self.total_cost, 2)])
+
+
+if __name__ == "__main__":
+    from connection import connect
+    from migrations import migrate
+
+    conn = connect()
+    migrate(conn)
+    plan = PurchasePlan(conn)
+    conn.close()
+    for type_name, count, cost in plan.type_rows():
+        print(f"{type_name}: материалов {count}, стоимость {cost:.2f}")
+    print(f"Итого: материалов {len(plan)}, стоимость {plan.total_cost:.2f}")
+    if len(sys.argv) > 1:
+        plan.write_csv(sys.argv[1])
+        print(f"План сохранен в {sys.argv[1]}")
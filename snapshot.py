@@ -0,0 +1,109 @@
+"""Снимок списка материалов на диске для быстрого запуска.
+
+Файл лежит рядом с базой (obraz_plus.db.materials) и хранит столбцы
+списка материалов: типизированные массивы и таблицу строк (наименования
+в UTF-8 через '\\0'). Файл открывается через mmap, массивы копируются
+в модель одним memcpy без разбора строк SQLite.
+
+Снимок действителен для номера записи журнала изменений (ChangeLog),
+с которым он сохранен: изменения после этого номера модель применяет
+из журнала, как при обычном обновлении.
+"""
+import mmap
+import os
+import struct
+from array import array
+
+MAGIC = b'OBRZMAT1'
+# magic, версия схемы, номер записи журнала, строк, байт наименований, байт типов
+HEADER = struct.Struct('<8sqqqqq')
+# Числовые столбцы в порядке записи: (имя, код array)
+COLUMNS = [('ids', 'q'), ('type_ids', 'q'), ('stock', 'd'), ('min_qty', 'd'), ('required', 'd')]
+
+
+def snapshot_path(db_path):
+    return db_path + '.materials'
+
+
+def write_snapshot(path, rows, change_seq, schema_version):
+    """Сохранить строки списка материалов (id, name, type_name, stock, min, required, type_id).
+
+    Файл пишется во временный и заменяется целиком, поэтому читатель
+    никогда не видит наполовину записанный снимок.
+    """
+    columns = {name: array(code) for name, code in COLUMNS}
+    names = bytearray()
+    type_names = bytearray()
+    for material_id, name, type_name, stock, min_qty, required, type_id in rows:
+        columns['ids'].append(material_id)
+        columns['type_ids'].append(type_id or 0)
+        columns['stock'].append(stock)
+        columns['min_qty'].append(min_qty)
+        columns['required'].append(required)
+        # '\0' - разделитель таблицы строк, внутри наименований его быть не должно
+        names += name.replace('\0', ' ').encode('utf-8') + b'\0'
+        type_names += (type_name or '').replace('\0', ' ').encode('utf-8') + b'\0'
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, schema_version, change_seq, len(columns['ids']), len(names), len(type_names)))
+        for name, _ in COLUMNS:
+            f.write(columns[name].tobytes())
+        f.write(names)
+        f.write(type_names)
+    os.replace(temp_path, path)
+    return len(columns['ids'])
+
+
+class Snapshot:
+    """Открытый снимок; None из open(), если файла нет или он другого формата"""
+
+    def __init__(self, mapped, schema_version, change_seq, rows, names_size, types_size):
+        self.mapped = mapped
+        self.schema_version = schema_version
+        self.change_seq = change_seq
+        self.rows = rows
+        self.names_size = names_size
+        self.types_size = types_size
+
+    @classmethod
+    def open(cls, path):
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(mapped) < HEADER.size:
+            mapped.close()
+            return None
+        magic, *fields = HEADER.unpack_from(mapped)
+        rows, names_size, types_size = fields[2:]
+        if magic != MAGIC or len(mapped) != HEADER.size + rows * 8 * len(COLUMNS) + names_size + types_size:
+            mapped.close()
+            return None
+        return cls(mapped, *fields)
+
+    def column(self, index):
+        """Числовой столбец как array той же типизации, что и в модели"""
+        name, code = COLUMNS[index]
+        start = HEADER.size + index * self.rows * 8
+        values = array(code)
+        values.frombytes(self.mapped[start:start + self.rows * 8])
+        return values
+
+    def columns(self):
+        return {name: self.column(index) for index, (name, _) in enumerate(COLUMNS)}
+
+    def strings(self, start, size):
+        if not self.rows:
+            return []
+        return self.mapped[start:start + size - 1].decode('utf-8').split('\0')
+
+    def names(self):
+        return self.strings(HEADER.size + self.rows * 8 * len(COLUMNS), self.names_size)
+
+    def type_names(self):
+        return self.strings(HEADER.size + self.rows * 8 * len(COLUMNS) + self.names_size, self.types_size)
+
+    def close(self):
+        self.mapped.close()
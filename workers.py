@@ -0,0 +1,241 @@
+import queue
+import threading
+import time
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class QueryTask(QRunnable):
+    """Вызов метода DatabaseManager в рабочем потоке"""
+
+    def __init__(self, runner, key, generation, method, args):
+        super().__init__()
+        # Временем жизни управляет исполнитель: задача хранится в running, пока не завершится
+        self.setAutoDelete(False)
+        self.runner = runner
+        self.key = key
+        self.generation = generation
+        self.method = method
+        self.args = args
+        self.cancelled = False
+
+    def run(self):
+        if self.cancelled:
+            # Сигнал все равно нужен, чтобы исполнитель освободил задачу
+            self.runner.task_finished.emit(self.key, self.generation, None)
+            return
+        try:
+            result = getattr(self.runner.thread_db(), self.method)(*self.args)
+        except Exception as e:
+            self.runner.task_failed.emit(self.key, self.generation, str(e))
+        else:
+            self.runner.task_finished.emit(self.key, self.generation, result)
+
+
+class AsyncQueryRunner(QObject):
+    """Асинхронные запросы к базе из GUI.
+
+    Каждый рабочий поток один раз открывает собственное соединение через
+    db_factory и пользуется им во всех своих задачах; shutdown() закрывает их.
+    Запросы имеют ключ: новый запрос с тем же ключом отменяет предыдущий,
+    а результат устаревшего запроса отбрасывается. Результаты приходят
+    в поток GUI через сигналы.
+    """
+    finished = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+    busy_changed = pyqtSignal(bool)
+
+    # Внутренние сигналы из рабочих потоков
+    task_finished = pyqtSignal(str, int, object)
+    task_failed = pyqtSignal(str, int, str)
+
+    def __init__(self, db_factory, parent=None, max_threads=2):
+        super().__init__(parent)
+        self.db_factory = db_factory
+        # id потока -> объект базы; threading.local в потоках пула не переживает задачу
+        self.databases = {}
+        self.lock = threading.Lock()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        # Потоки не завершаются по простою, чтобы не терять открытые соединения
+        self.pool.setExpiryTimeout(-1)
+        self.generation = 0
+        # key -> (generation, task, callback, error_callback)
+        self.pending = {}
+        # (key, generation) -> task: ссылки на задачи, пока они в пуле
+        self.running = {}
+        self.task_finished.connect(self.on_task_finished)
+        self.task_failed.connect(self.on_task_failed)
+
+    def thread_db(self):
+        thread_id = threading.get_ident()
+        with self.lock:
+            db = self.databases.get(thread_id)
+        if db is None:
+            # Запись создает только сам поток, поэтому фабрика вызывается вне блокировки
+            db = self.db_factory()
+            with self.lock:
+                self.databases[thread_id] = db
+        return db
+
+    def is_busy(self):
+        return bool(self.pending)
+
+    def submit(self, key, method, args=(), callback=None, error_callback=None):
+        """Выполнить db.<method>(*args) в фоне; callback(result) вызывается в потоке GUI"""
+        was_busy = self.is_busy()
+        self.cancel(key, notify=False)
+        self.generation += 1
+        task = QueryTask(self, key, self.generation, method, tuple(args))
+        self.pending[key] = (self.generation, task, callback, error_callback)
+        self.running[(key, self.generation)] = task
+        self.pool.start(task)
+        if not was_busy:
+            self.busy_changed.emit(True)
+
+    def cancel(self, key, notify=True):
+        entry = self.pending.pop(key, None)
+        if entry is None:
+            return
+        task = entry[1]
+        task.cancelled = True
+        # Если задача еще не начала выполняться, убираем ее из очереди
+        if self.pool.tryTake(task):
+            self.running.pop((key, entry[0]), None)
+        if notify and not self.is_busy():
+            self.busy_changed.emit(False)
+
+    def cancel_all(self):
+        for key in list(self.pending):
+            self.cancel(key)
+
+    def take(self, key, generation):
+        self.running.pop((key, generation), None)
+        entry = self.pending.get(key)
+        if entry is None or entry[0] != generation:
+            # Запрос отменен или заменен более новым
+            return None
+        del self.pending[key]
+        if not self.is_busy():
+            self.busy_changed.emit(False)
+        return entry
+
+    def on_task_finished(self, key, generation, result):
+        entry = self.take(key, generation)
+        if entry is None:
+            return
+        callback = entry[2]
+        if callback:
+            callback(result)
+        self.finished.emit(key, result)
+
+    def on_task_failed(self, key, generation, message):
+        entry = self.take(key, generation)
+        if entry is None:
+            return
+        error_callback = entry[3]
+        if error_callback:
+            error_callback(message)
+        self.failed.emit(key, message)
+
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.waitForDone()
+        # Задач больше нет: соединения рабочих потоков закрываются отсюда
+        with self.lock:
+            databases = list(self.databases.values())
+            self.databases.clear()
+        for db in databases:
+            db.close()
+
+
+# Служебные элементы очереди записи
+_FLUSH = object()
+_STOP = object()
+
+
+class WriteBehindQueue(QObject):
+    """Отложенная запись правок материалов в фоновом потоке.
+
+    Правки копятся не дольше delay секунд (или до MAX_BATCH штук) и пишутся
+    одной транзакцией через DatabaseManager.write_materials - один fsync на
+    пачку вместо одного на правку, поэтому db_factory может открывать базу
+    с профилем 'safe' (synchronous=FULL). Записанные правки приходят в поток GUI
+    сигналом written (список id, None - новый материал), отклоненные базой -
+    сигналом failed (список (id, данные, сообщение)). flush() и close()
+    возвращаются только после записи всех переданных правок.
+    """
+    FLUSH_DELAY = 0.5
+    MAX_BATCH = 500
+
+    written = pyqtSignal(list)
+    failed = pyqtSignal(list)
+
+    def __init__(self, db_factory, parent=None, delay=FLUSH_DELAY):
+        super().__init__(parent)
+        self.db_factory = db_factory
+        self.delay = delay
+        self.queue = queue.Queue()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='material-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, material_id, data):
+        if self.closed:
+            raise RuntimeError("Очередь записи уже закрыта")
+        self.queue.put((material_id, data))
+
+    def flush(self):
+        """Записать накопленные правки сейчас, не дожидаясь задержки"""
+        if not self.closed:
+            self.queue.put(_FLUSH)
+            self.queue.join()
+
+    def close(self):
+        """Записать все правки и остановить поток; повторный вызов ничего не делает"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def collect(self):
+        """Пачка правок: первая ждется без ограничения, остальные - до истечения задержки"""
+        item = self.queue.get()
+        batch = []
+        deadline = time.monotonic() + self.delay
+        while True:
+            if item is _FLUSH or item is _STOP:
+                return batch, item
+            batch.append(item)
+            if len(batch) >= self.MAX_BATCH:
+                return batch, None
+            try:
+                item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return batch, None
+
+    def run(self):
+        db = None
+        while True:
+            batch, marker = self.collect()
+            if batch:
+                try:
+                    if db is None:
+                        db = self.db_factory()
+                    rejected = dict(db.write_materials(batch))
+                except Exception as e:
+                    # Транзакция откатилась целиком или база не открылась: не записана
+                    # ни одна правка пачки; следующая пачка снова попробует открыть базу
+                    rejected = {index: str(e) for index in range(len(batch))}
+                saved = [material_id for index, (material_id, _) in enumerate(batch) if index not in rejected]
+                if saved:
+                    self.written.emit(saved)
+                if rejected:
+                    self.failed.emit([(*batch[index], message) for index, message in sorted(rejected.items())])
+            for _ in range(len(batch) + (marker is not None)):
+                self.queue.task_done()
+            if marker is _STOP:
+                break
+        if db is not None:
+            db.close()